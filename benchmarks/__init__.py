@@ -0,0 +1,22 @@
+"""Benchmarks for libsanctions, run against a local SQLite database.
+
+The database and the exports go to ``BENCH_PATH`` (a temporary directory
+by default, removed on exit). This has to be set up before ``libsanctions``
+is imported.
+"""
+import os
+import atexit
+import shutil
+import tempfile
+
+BENCH_PATH = os.environ.get('BENCH_PATH')
+if not BENCH_PATH:
+    BENCH_PATH = tempfile.mkdtemp(prefix='libsanctions-bench-')
+    atexit.register(shutil.rmtree, BENCH_PATH, True)
+os.environ.setdefault('DATA_PATH', BENCH_PATH)
+
+from django.conf import settings  # noqa
+
+if not settings.configured:
+    database = os.path.join(BENCH_PATH, 'bench.sqlite')
+    settings.configure(OFAC_DATABASE_URI='sqlite:///%s' % database)
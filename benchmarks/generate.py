@@ -0,0 +1,130 @@
+"""Generate synthetic sanctions records in the ``Entity.to_json`` format.
+
+    python -m benchmarks.generate 10000 > entities.ijson
+"""
+import sys
+import json
+import random
+from datetime import datetime, timedelta
+
+from libsanctions.util import clean_obj
+
+FIRST_NAMES = [
+    'Mohammed', 'Ahmad', 'Ali', 'Vladimir', 'Sergei', 'Kim', 'Maria',
+    'Olga', 'Hassan', 'Ibrahim', 'Yusuf', 'Omar', 'Abdul', 'Ivan',
+    'Elena', 'Fatima', 'Juan', 'Carlos', 'Li', 'Wei', 'Igor', 'Natalia'
+]
+LAST_NAMES = [
+    'Al-Rashid', 'Petrov', 'Ivanov', 'Hussein', 'Khan', 'Jong', 'Sokolov',
+    'Rahman', 'Haddad', 'Mansour', 'Gonzalez', 'Rodriguez', 'Zhang',
+    'Wang', 'Smirnov', 'Kuznetsov', 'Nasser', 'Qureshi', 'Karimov'
+]
+COMPANY_WORDS = [
+    'Trading', 'Shipping', 'Petroleum', 'Holdings', 'Industrial',
+    'Maritime', 'Finance', 'Import Export', 'General', 'Logistics'
+]
+COMPANY_TYPES = ['LLC', 'Ltd.', 'Co.', 'FZE', 'JSC', 'S.A.', 'GmbH']
+COUNTRIES = [
+    'Iran', 'Syria', 'Russia', 'North Korea', 'Iraq', 'Afghanistan',
+    'Lebanon', 'Yemen', 'Libya', 'Sudan', 'Venezuela', 'Cuba', 'Belarus',
+    'Myanmar', 'United Arab Emirates', 'Turkey', 'China', 'Pakistan'
+]
+CITIES = ['Tehran', 'Damascus', 'Moscow', 'Pyongyang', 'Baghdad', 'Kabul',
+          'Beirut', 'Dubai', 'Istanbul', 'Karachi', 'Caracas', 'Minsk']
+PROGRAMS = ['SDGT', 'IRAN', 'SYRIA', 'UKRAINE-EO13660', 'DPRK', 'IFSR',
+            'NPWMD', 'SDNTK', 'UN 1267', 'EU 2014/145']
+
+
+def _date(rng, start=1940, end=2017):
+    day = rng.randint(0, (end - start) * 365)
+    return (datetime(start, 1, 1) + timedelta(days=day)).date().isoformat()
+
+
+def _person_name(rng):
+    return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+
+def _company_name(rng):
+    return '%s %s %s' % (rng.choice(LAST_NAMES), rng.choice(COMPANY_WORDS),
+                         rng.choice(COMPANY_TYPES))
+
+
+def _alias(rng, name):
+    # Misspelled or re-ordered variants, like transliterations.
+    parts = name.split(' ')
+    if rng.random() < 0.5:
+        parts.reverse()
+    name = ' '.join(parts)
+    if rng.random() < 0.6 and len(name) > 3:
+        i = rng.randint(1, len(name) - 2)
+        name = name[:i] + name[i + 1:]
+    return {
+        'name': name,
+        'type': rng.choice(['aka', 'fka', 'nka']),
+        'quality': rng.choice(['weak', 'strong'])
+    }
+
+
+def generate_entity(rng, source, i, max_children=6):
+    """Generate one record shaped like ``Entity.to_json()``."""
+    data = {
+        'id': '%s.%s' % (source, i),
+        'source': source,
+        'program': rng.choice(PROGRAMS),
+        'listed_at': _date(rng, 1995),
+        'updated_at': _date(rng, 2010),
+        'timestamp': datetime.utcnow().isoformat(),
+        'url': 'https://example.org/entity/%s' % i,
+        'summary': rng.choice([None, 'Designated for providing support.']),
+    }
+    country = rng.choice(COUNTRIES)
+    if rng.random() < 0.7:
+        first, last = _person_name(rng)
+        data['type'] = 'individual'
+        data['first_name'] = first
+        data['last_name'] = last
+        data['name'] = '%s %s' % (first, last)
+        data['gender'] = rng.choice(['male', 'female'])
+        data['function'] = rng.choice([None, 'Minister', 'Commander'])
+        data['birth_dates'] = [{'date': _date(rng, 1940, 1990),
+                                'quality': 'strong'}
+                               for _ in range(rng.randint(0, 2))]
+        data['birth_places'] = [{'place': rng.choice(CITIES),
+                                 'country': country,
+                                 'quality': 'weak'}
+                                for _ in range(rng.randint(0, 1))]
+        data['nationalities'] = [{'country': country}]
+    else:
+        data['type'] = rng.choice(['entity', 'vessel'])
+        data['name'] = _company_name(rng)
+
+    data['aliases'] = [_alias(rng, data['name'])
+                       for _ in range(rng.randint(0, max_children))]
+    data['addresses'] = [{
+        'street': '%s Street %s' % (rng.choice(LAST_NAMES),
+                                    rng.randint(1, 300)),
+        'city': rng.choice(CITIES),
+        'postal_code': str(rng.randint(10000, 99999)),
+        'country': rng.choice(COUNTRIES)
+    } for _ in range(rng.randint(0, max_children // 2))]
+    data['identifiers'] = [{
+        'type': rng.choice(['passport', 'nationalid', 'other']),
+        'number': '%s%07d' % (rng.choice('ABCDEFGHJK'),
+                              rng.randint(0, 9999999)),
+        'country': country,
+        'issued_at': _date(rng, 1995)
+    } for _ in range(rng.randint(0, max_children // 2))]
+    return clean_obj(data)
+
+
+def generate_entities(count, source='bench', seed=42):
+    """Generate ``count`` records, the same ones for the same seed."""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield generate_entity(rng, source, i)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for data in generate_entities(count):
+        sys.stdout.write('%s\n' % json.dumps(data))
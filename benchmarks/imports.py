@@ -0,0 +1,63 @@
+"""Check that ``import libsanctions`` stays cheap.
+
+    python -m benchmarks.imports --budget 0.5
+
+The package is imported in fresh interpreters. The check fails if the
+best import time is over budget, or if any of the heavy dependencies
+which are only needed by some code paths were imported with it.
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+# Modules which must not be imported by ``import libsanctions``.
+HEAVY = ('django', 'morphium', 'boto', 'boto3', 'botocore', 'countrynames',
+         'dalet', 'fingerprints', 'numpy', 'requests')
+BUDGET = 0.5
+
+SCRIPT = """
+import sys, time, json
+%s
+start = time.time()
+import libsanctions
+print(json.dumps({'seconds': time.time() - start,
+                  'modules': sorted(sys.modules)}))
+"""
+
+
+def measure_import(repeat=5, preload=()):
+    """Best-of-``repeat`` import time, and the heavy modules imported.
+    The modules in ``preload`` are imported before the timer starts."""
+    best, heavy = None, set()
+    script = SCRIPT % '\n'.join('import %s' % name for name in preload)
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', script])
+        data = json.loads(output.decode('utf-8').strip().split('\n')[-1])
+        seconds = data['seconds']
+        best = seconds if best is None else min(best, seconds)
+        heavy.update(set(HEAVY).intersection(data['modules']))
+    return best, sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--budget', type=float, default=BUDGET,
+                        help='maximum import time in seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    seconds, heavy = measure_import(args.repeat)
+    print('import libsanctions: %.3fs (budget %.3fs)' % (seconds,
+                                                         args.budget))
+    failed = False
+    if seconds > args.budget:
+        print('Over budget.')
+        failed = True
+    if len(heavy):
+        print('Imported eagerly: %s' % ', '.join(heavy))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,113 @@
+"""Synthetic source files and memory measurement for the reader
+benchmarks."""
+import resource
+from multiprocessing import Pool
+from xml.sax.saxutils import escape
+
+SDN_NAMESPACE = 'http://tempuri.org/sdnList.xsd'
+
+
+def write_sdn_xml(records, file_path, repeat=1):
+    """Write ``records`` as an OFAC SDN-style XML list, ``repeat`` times
+    over to make the file larger."""
+    with open(file_path, 'wb') as fh:
+        fh.write(b'<?xml version="1.0" standalone="yes"?>\n')
+        fh.write(('<sdnList xmlns="%s">\n' % SDN_NAMESPACE).encode('utf-8'))
+        fh.write(b'<publshInformation><Record_Count>%d</Record_Count>'
+                 b'</publshInformation>\n' % (len(records) * repeat))
+        for i in range(repeat):
+            for data in records:
+                fh.write(_sdn_entry(data, i).encode('utf-8'))
+        fh.write(b'</sdnList>\n')
+
+
+def _sdn_entry(data, i):
+    parts = ['<sdnEntry><uid>%s-%s</uid>' % (escape(data['id']), i),
+             '<lastName>%s</lastName>' % escape(data['name']),
+             '<sdnType>%s</sdnType>' % data['type'],
+             '<programList><program>%s</program></programList>'
+             % escape(data['program'])]
+    parts.append('<akaList>')
+    for alias in data.get('aliases', []):
+        parts.append('<aka><type>%s</type><category>%s</category>'
+                     '<lastName>%s</lastName></aka>' %
+                     (alias['type'], alias['quality'],
+                      escape(alias['name'])))
+    parts.append('</akaList><addressList>')
+    for address in data.get('addresses', []):
+        parts.append('<address><address1>%s</address1><city>%s</city>'
+                     '<country>%s</country></address>' %
+                     (escape(address['street']), escape(address['city']),
+                      escape(address['country'])))
+    parts.append('</addressList></sdnEntry>\n')
+    return ''.join(parts)
+
+
+def _run_measured(func, args):
+    # ru_maxrss is the peak of the whole process, which starts out as
+    # a copy of the parent, so only the growth is reported.
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = func(*args)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result, after - before
+
+
+def peak_rss(func, *args):
+    """Run ``func(*args)`` in a fresh worker process. Returns its result
+    and how far it grew the peak resident set size (KB on Linux)."""
+    pool = Pool(1)
+    try:
+        return pool.apply(_run_measured, (func, args))
+    finally:
+        pool.close()
+        pool.join()
+
+
+TABLE_HEADERS = ['ID', 'Name', 'Program', 'Type', 'Listed at']
+# The row limit of the old .xls format, less the header.
+XLS_MAX_ROWS = 65535
+
+
+def _table_rows(records, repeat):
+    for i in range(repeat):
+        for data in records:
+            yield ['%s-%s' % (data['id'], i), data['name'], data['program'],
+                   data['type'], data.get('listed_at')]
+
+
+def write_table(records, file_path, repeat=1):
+    """Write ``records`` as a flat table in the format given by the file
+    extension. Returns False if the writer library is not installed."""
+    if file_path.endswith('.csv'):
+        from unicodecsv import writer
+        with open(file_path, 'wb') as fh:
+            csv = writer(fh)
+            csv.writerow(TABLE_HEADERS)
+            for row in _table_rows(records, repeat):
+                csv.writerow(row)
+    elif file_path.endswith('.xlsx'):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            return False
+        book = Workbook(write_only=True)
+        sheet = book.create_sheet()
+        sheet.append(TABLE_HEADERS)
+        for row in _table_rows(records, repeat):
+            sheet.append(row)
+        book.save(file_path)
+    else:
+        try:
+            import xlwt
+        except ImportError:
+            return False
+        book = xlwt.Workbook()
+        sheet = book.add_sheet('entities')
+        rows = _table_rows(records, repeat)
+        for i, row in enumerate([TABLE_HEADERS] + list(rows)):
+            if i > XLS_MAX_ROWS:
+                break
+            for j, value in enumerate(row):
+                sheet.write(i, j, value)
+        book.save(file_path)
+    return True
@@ -0,0 +1,383 @@
+"""Run the libsanctions benchmarks and store or compare their results.
+
+    python -m benchmarks.run --scale 5000 --output before.json
+    python -m benchmarks.run --scale 5000 --output after.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+from datetime import datetime
+from lxml import etree
+from unicodecsv import DictWriter
+
+from benchmarks import BENCH_PATH
+from benchmarks.generate import generate_entities
+from benchmarks.imports import measure_import
+from benchmarks.readers import SDN_NAMESPACE, write_sdn_xml, peak_rss
+from benchmarks.readers import write_table
+from libsanctions import Source, Entity, session
+from libsanctions.model import Base, get_engine
+from libsanctions.export import CSV_EXPORTS, write_csv_table, write_ijson
+from libsanctions.export import _row_fields, _state_path
+from libsanctions.delta import commit_state
+from libsanctions.offsets import IjsonReader
+from libsanctions.util import clean_obj, make_uid
+from libsanctions.util import remove_namespace, iterparse_records
+from libsanctions.ingest import RowLoader, insert_rows
+from libsanctions.tabular import iter_row_chunks
+from libsanctions.screen import build_name_index
+from libsanctions.resolve import resolve_entities
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def reset_database():
+    session.remove()
+    Base.metadata.drop_all(get_engine())
+    Base.metadata.create_all(get_engine())
+
+
+def load_records(records):
+    reset_database()
+    Entity.bulk_from_json(records)
+    session.commit()
+
+
+def measure(func, repeat, setup=None):
+    """Best-of-``repeat`` wall-clock time for ``func()``. ``setup()`` is
+    called before each run, outside of the timed section."""
+    best = None
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def result(seconds, items, unit='records'):
+    return {
+        'seconds': seconds,
+        'items': items,
+        'unit': unit,
+        'rate': items / seconds if seconds > 0 else None
+    }
+
+
+@benchmark
+def import_time(records, repeat):
+    seconds, heavy = measure_import(repeat)
+    yield 'import_libsanctions', result(seconds, 1, unit='imports')
+
+
+@benchmark
+def from_json(records, repeat):
+    def run():
+        for data in records:
+            Entity.from_json(data)
+        session.commit()
+    seconds = measure(run, repeat, setup=reset_database)
+    yield 'from_json', result(seconds, len(records))
+
+    def run_bulk():
+        Entity.bulk_from_json(records)
+        session.commit()
+    seconds = measure(run_bulk, repeat, setup=reset_database)
+    yield 'bulk_from_json', result(seconds, len(records))
+
+
+@benchmark
+def ingest(records, repeat):
+    lines = [json.dumps(data).encode('utf-8') for data in records]
+    for processes in (0, 2, 4):
+        def run():
+            loader = RowLoader(processes)
+            handles = [loader.submit(lines[i:i + 1000])
+                       for i in range(0, len(lines), 1000)]
+            for handle in handles:
+                insert_rows(handle.get())
+            session.commit()
+            loader.close()
+        seconds = measure(run, repeat, setup=reset_database)
+        yield 'ingest_%s_processes' % processes, \
+            result(seconds, len(records))
+
+
+@benchmark
+def create_entity_save(records, repeat):
+    def run():
+        source = Source('bench')
+        for data in records:
+            entity = source.create_entity(data['id'])
+            entity.name = data.get('name')
+            entity.program = data.get('program')
+            for alias in data.get('aliases', []):
+                entity.create_alias(name=alias.get('name'))
+            for identifier in data.get('identifiers', []):
+                obj = entity.create_identifier()
+                obj.number = identifier.get('number')
+                obj.country = identifier.get('country')
+            entity.save()
+        source.saves.flush()
+        session.remove()
+    yield 'create_entity_save', result(measure(run, repeat), len(records))
+
+
+def write_csv_orm(model, name):
+    # The ORM export which write_csv_table() replaced, for comparison.
+    fields = _row_fields(model)[0]
+    with open(os.path.join(BENCH_PATH, '%s.orm.csv' % name), 'w') as fh:
+        writer = DictWriter(fh, fields)
+        writer.writeheader()
+        for obj in session.query(model).yield_per(5000):
+            writer.writerow(obj.to_row())
+
+
+@benchmark
+def export_csv_tables(records, repeat):
+    load_records(records)
+    for model, name in CSV_EXPORTS:
+        rows = session.query(model).count()
+        seconds = measure(lambda: write_csv_table(model, name), repeat)
+        yield 'export_csv_%s' % name, result(seconds, rows, unit='rows')
+        seconds = measure(lambda: write_csv_orm(model, name), repeat)
+        yield 'export_csv_orm_%s' % name, result(seconds, rows, unit='rows')
+
+
+@benchmark
+def export_ijson(records, repeat):
+    load_records(records)
+    seconds = measure(lambda: write_ijson('bench'), repeat)
+    yield 'export_ijson', result(seconds, len(records))
+
+    # The first run writes the hashes which the later ones compare with.
+    write_ijson('bench', delta=True)
+    commit_state(_state_path('bench'))
+    seconds = measure(lambda: write_ijson('bench', delta=True), repeat)
+    yield 'export_ijson_delta', result(seconds, len(records))
+
+
+@benchmark
+def ijson_lookup(records, repeat):
+    load_records(records)
+    file_path = write_ijson('bench')[0]
+    ids = [data['id'] for data in records]
+    random.Random(42).shuffle(ids)
+    with IjsonReader(file_path) as reader:
+        def run():
+            for entity_id in ids:
+                reader.get_raw(entity_id)
+        yield 'ijson_lookup', result(measure(run, repeat), len(ids),
+                                     unit='lookups')
+
+        def run_shards():
+            for start, end in reader.shards(1024 * 1024):
+                for data in reader.iter_shard(start, end):
+                    pass
+        yield 'ijson_shards', result(measure(run_shards, repeat), len(ids))
+
+
+@benchmark
+def entity_to_json(records, repeat):
+    load_records(records)
+    entities = session.query(Entity).all()
+    for entity in entities:
+        for key, model in Entity.CHILDREN:
+            getattr(entity, key)
+
+    def run():
+        for entity in entities:
+            json.dumps(entity.to_json())
+    yield 'entity_to_json', result(measure(run, repeat), len(entities))
+
+
+@benchmark
+def clean_obj_uid(records, repeat):
+    def run_clean():
+        for data in records:
+            clean_obj(data)
+    yield 'clean_obj', result(measure(run_clean, repeat), len(records))
+
+    def run_uid():
+        for data in records:
+            make_uid(data['id'], data.get('name'), data.get('program'))
+    yield 'make_uid', result(measure(run_uid, repeat), len(records))
+
+
+@benchmark
+def resolve(records, repeat):
+    # A second source which lists half of the entities again.
+    copies = []
+    for data in records[:len(records) // 2]:
+        data = dict(data, source='copy')
+        data['id'] = data['id'].replace('bench.', 'copy.', 1)
+        copies.append(data)
+    load_records(records + copies)
+    build_name_index()
+    seconds = measure(resolve_entities, repeat)
+    canonical = dict(session.query(Entity.id, Entity.canonical_id))
+    found = 0
+    for data in copies:
+        original = data['id'].replace('copy.', 'bench.', 1)
+        if canonical[data['id']] is not None and \
+                canonical[data['id']] == canonical[original]:
+            found += 1
+    res = result(seconds, len(records) + len(copies))
+    res['recall'] = found / float(len(copies))
+    yield 'resolve', res
+
+
+def match_names(names, queries):
+    # Run in a fresh process by peak_rss(), to measure its memory use.
+    from libsanctions.match import Matcher
+    matcher = Matcher(names)
+    matcher.match_many(queries, limit=10, threshold=0.3)
+    return matcher.pairs_scored
+
+
+@benchmark
+def matcher(records, repeat):
+    try:
+        from libsanctions.match import Matcher
+    except ImportError:
+        return
+    names = []
+    for data in records:
+        names.append((data['id'], data['name']))
+        for alias in data.get('aliases', []):
+            names.append((data['id'], alias.get('name')))
+
+    # Query with a typo in each primary name; recall is the share of
+    # queries whose entity is among the top results.
+    rng = random.Random(7)
+    queries, expected = [], []
+    for data in records:
+        name = data['name']
+        i = rng.randint(0, len(name) - 1)
+        queries.append(name[:i] + rng.choice('aeiouxyz') + name[i + 1:])
+        expected.append(data['id'])
+
+    matcher = Matcher(names)
+    start = time.time()
+    results = matcher.match_many(queries, limit=10, threshold=0.3)
+    seconds = time.time() - start
+    found = 0
+    for entity_id, matches in zip(expected, results):
+        if entity_id in [m for (m, _) in matches]:
+            found += 1
+    pairs = result(seconds, matcher.pairs_scored, unit='pairs')
+    pairs['recall'] = found / float(len(queries))
+    pairs['rss_kb'] = peak_rss(match_names, names, queries)[1]
+    yield 'matcher', pairs
+
+
+def parse_xml_document(file_path):
+    doc = etree.parse(file_path)
+    remove_namespace(doc, SDN_NAMESPACE)
+    return len([e.findtext('uid') for e in doc.findall('.//sdnEntry')])
+
+
+def parse_xml_stream(file_path):
+    records = iterparse_records(file_path, 'sdnEntry', SDN_NAMESPACE)
+    return len([e.findtext('uid') for e in records])
+
+
+@benchmark
+def xml_reader(records, repeat):
+    file_path = os.path.join(BENCH_PATH, 'sdn.xml')
+    write_sdn_xml(records, file_path, repeat=10)
+    for name, func in (('xml_parse_document', parse_xml_document),
+                       ('xml_iterparse', parse_xml_stream)):
+        count, rss = peak_rss(func, file_path)
+        res = result(measure(lambda: func(file_path), repeat), count)
+        res['rss_kb'] = rss
+        yield name, res
+
+
+def read_table(file_path):
+    return sum(len(chunk) for chunk in iter_row_chunks(file_path))
+
+
+@benchmark
+def table_reader(records, repeat):
+    for extension in ('csv', 'xls', 'xlsx'):
+        file_path = os.path.join(BENCH_PATH, 'entities.%s' % extension)
+        if not write_table(records, file_path, repeat=10):
+            continue
+        count, rss = peak_rss(read_table, file_path)
+        res = result(measure(lambda: read_table(file_path), repeat), count,
+                     unit='rows')
+        res['rss_kb'] = rss
+        yield 'table_%s' % extension, res
+
+
+def run(scale, repeat, only=None):
+    records = list(generate_entities(scale))
+    results = {}
+    for func in BENCHMARKS:
+        if only and func.__name__ not in only:
+            continue
+        for name, res in func(records, repeat):
+            line = '%-32s %10.3fs %14.1f %s/s' % (
+                name, res['seconds'], res['rate'] or 0, res['unit'])
+            if 'rss_kb' in res:
+                line += '  rss +%.1fMB' % (res['rss_kb'] / 1024.0)
+            print(line)
+            results[name] = res
+    return {
+        'scale': scale,
+        'repeat': repeat,
+        'time': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'path': BENCH_PATH,
+        'results': results
+    }
+
+
+def compare(old_path, new_path):
+    with open(old_path, 'r') as fh:
+        old = json.load(fh)['results']
+    with open(new_path, 'r') as fh:
+        new = json.load(fh)['results']
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            print('%-32s %s' % (name, 'only in one run'))
+            continue
+        before, after = old[name]['rate'], new[name]['rate']
+        change = (after / before - 1) * 100 if before else 0
+        print('%-32s %14.1f -> %14.1f %+7.1f%%' % (
+            name, before, after, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', type=int, default=2000,
+                        help='number of synthetic entities')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='benchmarks to run')
+    parser.add_argument('--output', help='store the results as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args.scale, args.repeat, only=args.only)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,129 @@
+"""Load-test the screening service against a local SQLite database.
+
+    python -m benchmarks.service --scale 2000 --clients 16 --requests 4000
+
+Loads synthetic entities, starts the service on a free port and runs
+``--clients`` threads which each keep a connection open and send a mix
+of entity lookups and name screens. Reports the p50 and p99 latency and
+the requests per second of the service as configured, and of a baseline
+which sends one query per request and caches nothing.
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from six.moves.http_client import HTTPConnection
+from six.moves.urllib.parse import quote, urlencode
+
+from benchmarks.generate import generate_entities
+from libsanctions import Entity, session
+from libsanctions.model import Base, get_engine
+from libsanctions.screen import build_name_index
+from libsanctions.service import Service, ServiceServer
+
+# Share of the requests which screen a name rather than look up an id.
+SCREEN_SHARE = 0.3
+
+
+def load_database(records):
+    session.remove()
+    Base.metadata.drop_all(get_engine())
+    Base.metadata.create_all(get_engine())
+    Entity.bulk_from_json(records)
+    session.commit()
+    build_name_index()
+
+
+def make_paths(records, count, seed=7):
+    """Request paths for a mix of lookups and screens. Popular entities
+    are requested more often than others, like on a real service."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        data = records[min(int(rng.expovariate(5) * len(records)),
+                           len(records) - 1)]
+        if rng.random() < SCREEN_SHARE:
+            name = data['name'].encode('utf-8')
+            paths.append('/screen?%s' % urlencode({'name': name}))
+        else:
+            paths.append('/entities/%s' % quote(data['id'], safe=''))
+    return paths
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[int(round(share * (len(values) - 1)))]
+
+
+def load_test(paths, clients=16, **kwargs):
+    """Send ``paths`` from ``clients`` threads to a service created with
+    ``kwargs``. Returns the latencies, throughput and error count."""
+    service = Service(**kwargs)
+    server = ServiceServer(('127.0.0.1', 0), service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    latencies, errors = [], []
+
+    def client(paths):
+        conn = HTTPConnection('127.0.0.1', server.server_port)
+        for path in paths:
+            start = time.time()
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.time() - start)
+            if response.status != 200:
+                errors.append(path)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(paths[i::clients],))
+               for i in range(clients)]
+    start = time.time()
+    for client_thread in threads:
+        client_thread.start()
+    for client_thread in threads:
+        client_thread.join()
+    seconds = time.time() - start
+    server.shutdown()
+    server.server_close()
+    service.close()
+    return {
+        'requests': len(latencies),
+        'seconds': seconds,
+        'rate': len(latencies) / seconds,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'errors': len(errors)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', type=int, default=2000,
+                        help='number of synthetic entities')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+    records = list(generate_entities(args.scale))
+    load_database(records)
+    paths = make_paths(records, args.requests)
+    runs = (
+        ('baseline', dict(window=0, batch_size=1, cache_ttl=0)),
+        ('service', {}),
+    )
+    failed = False
+    for name, options in runs:
+        stats = load_test(paths, clients=args.clients, workers=args.workers,
+                          **options)
+        print('%-10s %8.1f req/s  p50 %7.2fms  p99 %7.2fms  %s errors' %
+              (name, stats['rate'], stats['p50'] * 1000,
+               stats['p99'] * 1000, stats['errors']))
+        failed = failed or stats['errors'] > 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -7,6 +7,7 @@ from libsanctions.model import session  # noqa
 from libsanctions.model import Identifier, Entity, Alias, Address  # noqa
 from libsanctions.model import BirthPlace, BirthDate  # noqa
 from libsanctions.util import make_uid  # noqa
+from libsanctions.screen import screen, screen_many  # noqa
 
 warnings.simplefilter("ignore")
 
@@ -0,0 +1,126 @@
+import time
+import threading
+from collections import OrderedDict
+from normality import stringify, slugify
+
+from libsanctions.config import NORM_CACHE_SIZE
+
+
+MISSING = object()
+
+
+class LRUCache(object):
+    """A bounded, least-recently-used cache, e.g. for the results of pure
+    functions, with hit, miss and eviction counters."""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _item(self, value):
+        # What is stored for ``value``; subclasses can add to it.
+        return value
+
+    def _value(self, item):
+        return item
+
+    def _expired(self, item):
+        return False
+
+    def get(self, key, default=None):
+        """Get the value stored for ``key``, or ``default``. Raises a
+        ``TypeError`` if the key is not hashable."""
+        with self.lock:
+            try:
+                item = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if self._expired(item):
+                self.misses += 1
+                return default
+            self.data[key] = item
+            self.hits += 1
+            return self._value(item)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = self._item(value)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def memoize(self, func):
+        def wrapper(value, *args, **kwargs):
+            # The type is part of the key because e.g. 1 == True.
+            key = (func, type(value), value, args,
+                   tuple(sorted(kwargs.items())))
+            try:
+                result = self.get(key, MISSING)
+            except TypeError:
+                # Not hashable, so there is no way to cache it.
+                return func(value, *args, **kwargs)
+            if result is MISSING:
+                result = func(value, *args, **kwargs)
+                self.set(key, result)
+            return result
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def stats(self):
+        return {
+            'size': len(self.data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+class TTLCache(LRUCache):
+    """An ``LRUCache`` of values which expire ``ttl`` seconds after they
+    were stored."""
+
+    def __init__(self, size, ttl):
+        super(TTLCache, self).__init__(size)
+        self.ttl = ttl
+
+    def _item(self, value):
+        return (time.time() + self.ttl, value)
+
+    def _value(self, item):
+        return item[1]
+
+    def _expired(self, item):
+        return item[0] < time.time()
+
+
+# Shared by all the normalisation paths: column binds, country codes and
+# entity id slugs see the same values over and over again.
+cache = LRUCache(NORM_CACHE_SIZE)
+cached_stringify = cache.memoize(stringify)
+cached_slugify = cache.memoize(slugify)
+
+
+# dalet and countrynames load large data tables, so they are only
+# imported once a value misses the cache.
+@cache.memoize
+def cached_parse_date(value):
+    from dalet import parse_date
+    return parse_date(value)
+
+
+@cache.memoize
+def cached_country_code(name):
+    import countrynames
+    return countrynames.to_code(name)
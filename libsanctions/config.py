@@ -1,9 +1,73 @@
 import os
 
-from django.conf import settings
+from libsanctions.util import lazy_attributes
 
 DATA_PATH = os.environ.get('DATA_PATH', '.')
 #DATABASE_URI = 'sqlite:///data.sqlite'
 #DATABASE_URI = os.environ.get('DATABASE_URI') or DATABASE_URI
-DATABASE_URI = settings.OFAC_DATABASE_URI
 BUCKET = os.environ.get('AWS_BUCKET', 'data.opensanctions.org')
+
+# Saved entities are committed every COMMIT_SIZE saves or COMMIT_INTERVAL
+# seconds, whichever comes first.
+COMMIT_SIZE = int(os.environ.get('COMMIT_SIZE', 1000))
+COMMIT_INTERVAL = float(os.environ.get('COMMIT_INTERVAL', 30))
+
+# Keep the tables of the previous run and only rewrite entities whose
+# content has changed.
+INCREMENTAL = os.environ.get('INCREMENTAL', '').lower() in ('1', 'true')
+
+# Number of exports which are written in parallel by Source.finish().
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 4))
+
+# Compress exports on the fly (gzip, bz2 or lzma) and upload them while
+# they are written, instead of writing plain files to DATA_PATH first.
+# Single exports can be set apart, e.g. "gzip,snapshot=none" keeps the
+# snapshot uncompressed so it can be memory-mapped. lzma needs
+# backports.lzma on Python 2.
+EXPORT_COMPRESSION = os.environ.get('EXPORT_COMPRESSION') or None
+
+# Also export the entities which changed since the previous export, see
+# libsanctions.delta.
+EXPORT_DELTA = os.environ.get('EXPORT_DELTA', 'true').lower() in ('1', 'true')
+
+# Also write a memory-mapped snapshot of the entities, see
+# libsanctions.snapshot.
+EXPORT_SNAPSHOT = os.environ.get('EXPORT_SNAPSHOT', 'true').lower() in \
+    ('1', 'true')
+
+# Number of results kept by the shared normalisation cache.
+NORM_CACHE_SIZE = int(os.environ.get('NORM_CACHE_SIZE', 50000))
+
+# Send run metrics to a statsd daemon, if set.
+STATSD_HOST = os.environ.get('STATSD_HOST') or None
+STATSD_PORT = int(os.environ.get('STATSD_PORT', 8125))
+
+# The screening service (libsanctions.service) queries the database on
+# SERVICE_WORKERS pooled connections. Requests which arrive within
+# SERVICE_BATCH_WINDOW seconds of each other share one query.
+SERVICE_WORKERS = int(os.environ.get('SERVICE_WORKERS', 4))
+SERVICE_BATCH_WINDOW = float(os.environ.get('SERVICE_BATCH_WINDOW', 0.002))
+
+# Seconds for which the service keeps a lookup or screening result, and
+# the number of results it keeps.
+SERVICE_CACHE_TTL = float(os.environ.get('SERVICE_CACHE_TTL', 300))
+SERVICE_CACHE_SIZE = int(os.environ.get('SERVICE_CACHE_SIZE', 10000))
+
+# How often, in seconds, the service checks the database for a finished
+# Source run (in any process), to drop the cached results.
+SERVICE_CHECK_INTERVAL = float(os.environ.get('SERVICE_CHECK_INTERVAL', 5))
+
+# Downloaded source files, revalidated with conditional requests.
+FETCH_CACHE_PATH = os.environ.get('FETCH_CACHE_PATH') or \
+    os.path.join(DATA_PATH, 'fetch')
+
+
+def database_uri():
+    """Read the database URI from the Django settings. This is done on
+    first use, so that importing libsanctions does not set up Django."""
+    from django.conf import settings
+    return settings.OFAC_DATABASE_URI
+
+
+# Deprecated: the database URI, read on access. Use database_uri().
+lazy_attributes(__name__, DATABASE_URI=database_uri)
@@ -0,0 +1,133 @@
+import os
+import json
+import logging
+
+from libsanctions.util import entity_hash
+
+log = logging.getLogger(__name__)
+
+
+def make_version(hashes):
+    """Combine entity hashes into a version of the whole export. The
+    combination does not depend on the order of the entities."""
+    version = 0
+    for content_hash in hashes:
+        version ^= int(content_hash, 16)
+    return '%040x' % version
+
+
+def load_state(state_path):
+    """Read the ``id -> hash`` map written by the previous export."""
+    if not os.path.exists(state_path):
+        return None
+    hashes = {}
+    with open(state_path, 'rb') as fh:
+        for line in fh:
+            line = line.decode('utf-8').rstrip('\n')
+            entity_id, content_hash = line.split('\t')
+            hashes[entity_id] = content_hash
+    return hashes
+
+
+class DeltaWriter(object):
+    """Write the changes between this export of a source and the last.
+
+    The delta has one JSON object per line: a ``begin`` line with the
+    version of the previous export, an ``add``, ``modify`` or ``remove``
+    line per changed entity and an ``end`` line with the new version and
+    the counts. A consumer which holds the previous version can apply it
+    with ``apply_delta``; others have to get the full export.
+
+    The hashes of this export are written next to ``state_path``, and
+    only replace it once ``commit_state`` is called, i.e. once the export
+    has been published; until then, the next run still compares with the
+    last published export. Without a state, there is no previous version
+    and every entity is listed as added."""
+
+    def __init__(self, fh, state_path):
+        self.fh = fh
+        self.name = fh.name
+        self.state_path = state_path
+        self.previous = load_state(state_path)
+        previous_version = None
+        if self.previous is not None:
+            previous_version = make_version(self.previous.values())
+        else:
+            self.previous = {}
+        self.state = open(state_path + '.tmp', 'wb')
+        self.version = 0
+        self.counts = {'added': 0, 'modified': 0, 'removed': 0}
+        self._write({'op': 'begin', 'previous': previous_version})
+
+    def _write(self, obj):
+        self.fh.write('%s\n' % json.dumps(obj))
+
+    def add(self, data):
+        """Compare an entity of this export with the previous one."""
+        entity_id = data['id']
+        content_hash = entity_hash(data)
+        line = u'%s\t%s\n' % (entity_id, content_hash)
+        self.state.write(line.encode('utf-8'))
+        self.version ^= int(content_hash, 16)
+        previous = self.previous.pop(entity_id, None)
+        if previous == content_hash:
+            return
+        if previous is None:
+            self.counts['added'] += 1
+            self._write({'op': 'add', 'entity': data})
+        else:
+            self.counts['modified'] += 1
+            self._write({'op': 'modify', 'entity': data})
+
+    def close(self):
+        for entity_id in sorted(self.previous):
+            self.counts['removed'] += 1
+            self._write({'op': 'remove', 'id': entity_id})
+        end = {'op': 'end', 'version': '%040x' % self.version}
+        end.update(self.counts)
+        self._write(end)
+        self.fh.close()
+        self.state.close()
+        log.info("Delta [%s]: %s added, %s modified, %s removed",
+                 self.name, self.counts['added'], self.counts['modified'],
+                 self.counts['removed'])
+
+    def abort(self):
+        self.state.close()
+        os.unlink(self.state_path + '.tmp')
+        if hasattr(self.fh, 'abort'):
+            self.fh.abort()
+        else:
+            self.fh.close()
+
+
+def commit_state(state_path):
+    """Make the hashes of the last ``DeltaWriter`` the state the next
+    export compares with. Does nothing if no delta was written."""
+    if os.path.exists(state_path + '.tmp'):
+        os.rename(state_path + '.tmp', state_path)
+
+
+def discard_state(state_path):
+    """Drop the hashes of a delta which was not published."""
+    if os.path.exists(state_path + '.tmp'):
+        os.unlink(state_path + '.tmp')
+
+
+def apply_delta(entities, lines, version):
+    """Apply the delta in ``lines`` to ``entities``, a dict of entity
+    JSON by id which is at ``version`` (see ``make_version`` over the
+    ``entity_hash`` of each). Returns the new version."""
+    for line in lines:
+        change = json.loads(line)
+        op = change['op']
+        if op == 'begin' and change['previous'] != version:
+            raise ValueError("Delta does not apply to version %s" % version)
+        elif op in ('add', 'modify'):
+            entity = change['entity']
+            entities[entity['id']] = entity
+        elif op == 'remove':
+            entities.pop(change['id'], None)
+        elif op == 'end':
+            return change['version']
+    raise ValueError("Delta is incomplete.")
@@ -1,10 +1,23 @@
 import os
 import json
+import time
 import logging
-from unicodecsv import DictWriter
+import six
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from unicodecsv import writer as csv_writer, DictWriter
+from sqlalchemy.orm.attributes import set_committed_value
 
-from libsanctions.config import DATA_PATH
-from libsanctions.model import session
+from libsanctions.config import DATA_PATH, EXPORT_WORKERS
+from libsanctions.config import EXPORT_COMPRESSION, EXPORT_DELTA
+from libsanctions.config import EXPORT_SNAPSHOT
+from libsanctions.delta import DeltaWriter, commit_state, discard_state
+from libsanctions.offsets import IndexWriter, INDEX_SUFFIX
+from libsanctions.snapshot import SnapshotWriter
+from libsanctions.sink import ExportSink, parse_compression
+from libsanctions.sink import compression_for, check_compression
+from libsanctions.metrics import metrics
+from libsanctions.model import session, get_engine, NameMixIn
 from libsanctions.model import Entity, Address, Alias, Nationality
 from libsanctions.model import Identifier, BirthDate, BirthPlace
 
@@ -18,6 +31,13 @@ CSV_EXPORTS = (
     (BirthPlace, 'birthplaces'),
     (Nationality, 'nationalities')
 )
+EXPORT_CHUNK = 500
+MIME_TYPES = {
+    '.csv': 'text/csv',
+    '.ijson': 'application/json',
+    '.snapshot': 'application/octet-stream',
+    INDEX_SUFFIX: 'application/octet-stream'
+}
 
 
 def _make_export_path():
@@ -29,45 +49,404 @@ def _make_export_path():
     return export_path
 
 
+def _open_file(file_name, mode='w'):
+    return open(os.path.join(_make_export_path(), file_name), mode)
+
+
+def _state_path(source):
+    return os.path.join(DATA_PATH, '%s.hashes' % source)
+
+
+def _open_delta(source, open_file):
+    return DeltaWriter(open_file('%s.delta.ijson' % source),
+                       _state_path(source))
+
+
+def _open_index(source, open_file):
+    return IndexWriter(open_file('%s.ijson%s' % (source, INDEX_SUFFIX), 'wb'))
+
+
+@metrics.timed('upload_file')
+def upload_export(archive, file_path):
+    """Upload an export file, and remove it once it has been archived."""
+    mime_type = MIME_TYPES.get(os.path.splitext(file_path)[1])
+    url = archive.upload_file(file_path, mime_type=mime_type)
+    if url is not None:
+        os.unlink(file_path)
+    return url
+
+
 def export_csv_tables(archive):
     for model, file_name in CSV_EXPORTS:
         export_csv_table(archive, model, file_name)
 
 
-def export_csv_table(archive, model, name):
-    file_path = os.path.join(_make_export_path(), '%s.csv' % name)
-    log.info("Exporting CSV to %s...", file_path)
+def _row_fields(model):
+    """Get the ``to_row()`` field names of ``model``, the table columns to
+    select and a function which turns a selected tuple into a CSV row."""
+    fields = list(model.row_keys())
+    columns = list(model.__table__.columns)
+    index = dict((c.name, i) for (i, c) in enumerate(columns))
+
+    def column(name):
+        i = index[name]
+        return lambda r: r[i]
+
+    getters = []
+    for field in fields:
+        if field == 'name' and issubclass(model, NameMixIn):
+            parts = [index[p] for p in NameMixIn.NAME_COLUMNS]
+            getters.append(lambda r, p=parts: NameMixIn.compose_name(
+                *[r[i] for i in p]))
+        elif field == 'country':
+            getters.append(column('country_name'))
+        elif field == 'timestamp':
+            i = index['timestamp']
+            getters.append(lambda r, i=i: r[i].isoformat())
+        else:
+            getters.append(column(field))
+
+    def make_row(record):
+        return [g(record) for g in getters]
+    return fields, columns, make_row
+
+
+def _partition(q, table, partition):
+    if partition is not None:
+        q = q.filter(table.c.source == partition)
+    return q
+
+
+@metrics.timed('export_csv_table')
+def write_csv_table(model, name, open_file=_open_file, partition=None):
+    """Write a table as CSV; with ``partition``, only the rows of that
+    source."""
+    fields, columns, make_row = _row_fields(model)
+    q = _partition(session.query(*columns), model.__table__, partition)
     writer = None
-    with open(file_path, 'w') as fh:
-        for obj in session.query(model):
-            row = obj.to_row()
+    count = 0
+    with open_file('%s.csv' % name) as fh:
+        log.info("Exporting CSV to %s...", fh.name)
+        for record in q.yield_per(5000):
             if writer is None:
-                writer = DictWriter(fh, row.keys())
-                writer.writeheader()
-            writer.writerow(row)
+                writer = csv_writer(fh)
+                writer.writerow(fields)
+            writer.writerow(make_row(record))
+            count += 1
+    metrics.incr('csv_rows', count)
+    return fh.name
 
-    url = archive.upload_file(file_path, mime_type='text/csv')
-    if url is not None:
-        os.unlink(file_path)
+
+def export_csv_table(archive, model, name):
+    upload_export(archive, write_csv_table(model, name))
 
 
-def export_isjon_entity(source, entity_id, fh):
-    # this is implemented one by one to circumvent morph.io resource
-    # limits.
-    entity = Entity.by_id(source, entity_id)
-    line = json.dumps(entity.to_json())
-    fh.write('%s\n' % line)
-    session.expunge(entity)
+def load_children(entities, session=session):
+    """Fetch the child records of ``entities`` with one query per child
+    table, instead of lazy-loading them entity by entity. Returns the
+    entities and all the children loaded for them."""
+    ids = [e.id for e in entities]
+    loaded = list(entities)
+    for key, model in Entity.CHILDREN:
+        children = {}
+        q = session.query(model).filter(model.entity_id.in_(ids))
+        for child in q.order_by(model.id):
+            children.setdefault(child.entity_id, []).append(child)
+            loaded.append(child)
+        for entity in entities:
+            set_committed_value(entity, key, children.get(entity.id, []))
+    return loaded
+
+
+def iter_entity_chunks(chunk_size=EXPORT_CHUNK, partition=None):
+    """Yield lists of entities with all their child records loaded.
+
+    Entities are paged by id, and the children for each page are fetched
+    with ``load_children``. A page is expunged from the session once the
+    consumer has moved on, so memory stays bounded by ``chunk_size``.
+    With ``partition``, only the entities of that source are read."""
+    last_id = None
+    while True:
+        q = _partition(session.query(Entity), Entity.__table__, partition)
+        if last_id is not None:
+            q = q.filter(Entity.id > last_id)
+        entities = q.order_by(Entity.id).limit(chunk_size).all()
+        if not len(entities):
+            return
+        last_id = entities[-1].id
+        loaded = load_children(entities)
+        yield entities
+        for obj in loaded:
+            session.expunge(obj)
+
+
+@metrics.timed('export_ijson')
+def write_ijson(source, open_file=_open_file, partition=None, delta=False):
+    """Write the entities as JSON lines, and an index of their byte
+    offsets (see ``libsanctions.offsets``). With ``delta``, also write
+    the changes since the previous export; see ``libsanctions.delta``.
+    The next delta is only against this one after ``commit_state``.
+    Returns the paths of all files written."""
+    index = _open_index(source, open_file)
+    changes = _open_delta(source, open_file) if delta else None
+    try:
+        with open_file('%s.ijson' % source) as fh:
+            log.info("Exporting iJSON to %s...", fh.name)
+            for entities in iter_entity_chunks(partition=partition):
+                for entity in entities:
+                    data = entity.to_json()
+                    line = json.dumps(data)
+                    fh.write('%s\n' % line)
+                    # The JSON is ASCII-only, one byte per character.
+                    index.add(entity.id, len(line))
+                    if changes is not None:
+                        changes.add(data)
+    except Exception:
+        for writer in (index, changes):
+            if writer is not None:
+                writer.abort()
+        raise
+    index.close()
+    if changes is None:
+        return [fh.name, index.name]
+    changes.close()
+    return [fh.name, index.name, changes.name]
 
 
 def export_ijson(archive, source):
-    file_path = os.path.join(_make_export_path(), '%s.ijson' % source)
-    log.info("Exporting iJSON to %s...", file_path)
-    with open(file_path, 'w') as fh:
-        q = session.query(Entity.id, Entity.source)
-        for (ent_id, ent_source) in q.yield_per(5000):
-            export_isjon_entity(ent_source, ent_id, fh)
-
-    url = archive.upload_file(file_path, mime_type='application/json')
-    if url is not None:
-        os.unlink(file_path)
+    for file_path in write_ijson(source):
+        upload_export(archive, file_path)
+
+
+def _id_order(column):
+    # Snapshots are searched by the bytes of the ids, which is how SQLite
+    # compares them; PostgreSQL needs the "C" collation to do the same.
+    if get_engine().dialect.name == 'postgresql':
+        return column.collate('C')
+    return column
+
+
+def _with_parents(ids, rows, parent_field):
+    """Pair child rows with the position of their entity in ``ids``.
+    Both come in id order, so this is a merge; rows of entities which
+    are not in ``ids`` are left out."""
+    ids = iter(ids)
+    position, current = -1, None
+    for row in rows:
+        key = row.pop(parent_field)
+        if key is None:
+            continue
+        key = key.encode('utf-8')
+        while current is None or current < key:
+            current = next(ids, None)
+            if current is None:
+                return
+            current = current.encode('utf-8')
+            position += 1
+        if current == key:
+            yield position, row
+
+
+@metrics.timed('export_snapshot')
+def write_snapshot(source, open_file=_open_file, partition=None):
+    """Write the entities to a snapshot (see ``libsanctions.snapshot``),
+    streaming them through the writer's temporary files. With
+    ``partition``, only the entities of that source are written."""
+    writer = SnapshotWriter()
+
+    def entity_ids():
+        q = session.query(Entity.id)
+        q = _partition(q, Entity.__table__, partition)
+        q = q.order_by(_id_order(Entity.id))
+        return (i for (i,) in q.yield_per(5000))
+
+    try:
+        fields, columns, make_row = _row_fields(Entity)
+        q = _partition(session.query(*columns), Entity.__table__, partition)
+        q = q.order_by(_id_order(Entity.id))
+        writer.add_entities(fields, (make_row(r) for r in q.yield_per(5000)))
+
+        for key, model in Entity.CHILDREN:
+            fields, columns, make_row = _row_fields(model)
+            parent_field = fields.index('entity_id')
+            del fields[parent_field]
+            table = model.__table__
+            q = _partition(session.query(*columns), table, partition)
+            q = q.order_by(_id_order(table.c.entity_id), table.c.id)
+            rows = (make_row(r) for r in q.yield_per(5000))
+            ids = entity_ids()
+            writer.add_children(key, fields,
+                                _with_parents(ids, rows, parent_field))
+
+        with open_file('%s.snapshot' % source, 'wb') as fh:
+            log.info("Exporting snapshot to %s...", fh.name)
+            writer.write(fh)
+    finally:
+        writer.close()
+    return fh.name
+
+
+def export_snapshot(archive, source):
+    upload_export(archive, write_snapshot(source))
+
+
+def _abort(writer):
+    if hasattr(writer, 'abort'):
+        writer.abort()
+    else:
+        writer.close()
+
+
+def write_single_pass(source, open_file=_open_file, partition=None,
+                      delta=False):
+    """Write the CSV tables and the ijson export in one pass over the
+    entities and their children. Rows are grouped by entity, so the CSV
+    files are ordered differently than those of ``write_csv_table``.
+    If anything fails, all files are closed and any uploads aborted."""
+    handles, writers = {}, {}
+    index, changes = None, None
+
+    def write_row(obj):
+        model = type(obj)
+        if model not in writers:
+            fields = _row_fields(model)[0]
+            writers[model] = DictWriter(handles[model], fields)
+            writers[model].writeheader()
+        writers[model].writerow(obj.to_row())
+
+    try:
+        for model, name in CSV_EXPORTS:
+            handles[model] = open_file('%s.csv' % name)
+        index = _open_index(source, open_file)
+        if delta:
+            changes = _open_delta(source, open_file)
+        log.info("Exporting CSV and iJSON for %s...", source)
+        with open_file('%s.ijson' % source) as fh:
+            for entities in iter_entity_chunks(partition=partition):
+                for entity in entities:
+                    write_row(entity)
+                    for key, _ in Entity.CHILDREN:
+                        for child in getattr(entity, key):
+                            write_row(child)
+                    data = entity.to_json()
+                    line = json.dumps(data)
+                    fh.write('%s\n' % line)
+                    index.add(entity.id, len(line))
+                    if changes is not None:
+                        changes.add(data)
+    except Exception:
+        for writer in list(handles.values()) + [index, changes]:
+            if writer is not None:
+                try:
+                    _abort(writer)
+                except Exception:
+                    log.exception("Failed to abort %s", writer.name)
+        raise
+    for handle in handles.values():
+        handle.close()
+    index.close()
+    names = [handles[m].name for (m, _) in CSV_EXPORTS]
+    names.extend([fh.name, index.name])
+    if changes is not None:
+        changes.close()
+        names.append(changes.name)
+    return names
+
+
+def export_all(archive, source, workers=EXPORT_WORKERS, single_pass=False,
+               compression=EXPORT_COMPRESSION, delta=EXPORT_DELTA,
+               snapshot=EXPORT_SNAPSHOT, partition=None):
+    """Run all exports of ``source`` on a pool of ``workers`` threads.
+
+    Files are uploaded on a separate thread as soon as they have been
+    written, while the remaining exports continue. If ``compression`` is
+    set, exports are instead streamed through an ``ExportSink``, which
+    compresses and uploads them while they are written. It is a codec,
+    or a setting like ``EXPORT_COMPRESSION`` or a dict with a codec by
+    export name (see ``libsanctions.sink.parse_compression``). Returns
+    a dict with the wall-clock seconds spent on each export and upload.
+    With ``delta``, the ijson export comes with a delta against the last
+    run, which becomes the base of the next delta once all files have
+    been uploaded. With ``snapshot`` a snapshot is written as well. With
+    ``partition``, only the entities of that source are exported."""
+    if isinstance(compression, six.string_types):
+        compression = parse_compression(compression)
+    export_path = _make_export_path()
+
+    def make_open_file(codec):
+        if codec is None:
+            return _open_file
+
+        def open_file(file_name, mode='w'):
+            return ExportSink(archive, file_name, export_path,
+                              compression=codec)
+        return open_file
+
+    jobs = []
+    if single_pass:
+        jobs.append(('tables', partial(write_single_pass, delta=delta),
+                     (source,)))
+    else:
+        for model, name in CSV_EXPORTS:
+            jobs.append((name, write_csv_table, (model, name)))
+        jobs.append(('ijson', partial(write_ijson, delta=delta),
+                     (source,)))
+    if snapshot:
+        jobs.append(('snapshot', write_snapshot, (source,)))
+    jobs = [(name, partial(func, partition=partition), args)
+            for (name, func, args) in jobs]
+    check_compression(compression, [name for (name, _, _) in jobs])
+
+    uploader = ThreadPool(1)
+
+    def upload(file_path):
+        start = time.time()
+        upload_export(archive, file_path)
+        return 'upload:%s' % os.path.basename(file_path), time.time() - start
+
+    def run(job):
+        # Returns the timing of the export and the pending uploads of
+        # its files; each task reports its own results.
+        name, func, args = job
+        codec = compression_for(compression, name)
+        start = time.time()
+        try:
+            paths = func(*args, open_file=make_open_file(codec))
+        finally:
+            # Each thread has its own scoped session.
+            session.remove()
+        seconds = time.time() - start
+        if codec is not None:
+            return name, seconds, []
+        if not isinstance(paths, list):
+            paths = [paths]
+        uploads = [uploader.apply_async(upload, (p,)) for p in paths]
+        return name, seconds, uploads
+
+    timings = {}
+    published = False
+    pool = ThreadPool(workers)
+    try:
+        uploads = []
+        for result in [pool.apply_async(run, (job,)) for job in jobs]:
+            name, seconds, pending = result.get()
+            timings[name] = seconds
+            uploads.extend(pending)
+        timings.update(result.get() for result in uploads)
+        published = True
+    finally:
+        pool.close()
+        uploader.close()
+        pool.join()
+        uploader.join()
+        if delta:
+            # The next delta is against this export only if all of it
+            # was uploaded; otherwise against the one before.
+            if published:
+                commit_state(_state_path(source))
+            else:
+                discard_state(_state_path(source))
+
+    for name, seconds in sorted(timings.items()):
+        log.info("Export [%s]: %.2fs", name, seconds)
+    return timings
@@ -0,0 +1,83 @@
+import os
+import json
+import logging
+import requests
+from hashlib import sha1
+from collections import namedtuple
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+Download = namedtuple('Download', ['url', 'file_path', 'content_hash',
+                                   'cached'])
+
+
+class FetchCache(object):
+    """An on-disk cache of HTTP downloads, keyed by URL.
+
+    Cached files are revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``. On a ``304 Not Modified`` the cached copy is
+    used again. All requests share one pooled ``requests.Session``."""
+
+    def __init__(self, path, pool_size=10):
+        self.path = path
+        try:
+            os.makedirs(path)
+        except OSError:
+            pass
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _paths(self, url):
+        key = sha1(url.encode('utf-8')).hexdigest()
+        file_path = os.path.join(self.path, key)
+        return file_path, file_path + '.json'
+
+    def _load_meta(self, file_path, meta_path):
+        if not os.path.exists(file_path) or not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as fh:
+            return json.load(fh)
+
+    def fetch(self, url):
+        """Download ``url`` unless the cached copy is still current.
+        Returns a ``Download``, or None if the URL cannot be fetched.
+        The file is complete once this returns; it is not streamed to
+        the caller while it downloads."""
+        file_path, meta_path = self._paths(url)
+        meta = self._load_meta(file_path, meta_path)
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        res = self.session.get(url, headers=headers, stream=True)
+        if res.status_code == 304 and meta is not None:
+            res.close()
+            log.info("Not modified: %s", url)
+            return Download(url, file_path, meta['content_hash'], True)
+        if res.status_code != 200:
+            res.close()
+            return None
+
+        digest = sha1()
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'wb') as fh:
+            for chunk in res.iter_content(chunk_size=1024 * 64):
+                digest.update(chunk)
+                fh.write(chunk)
+        os.rename(tmp_path, file_path)
+        meta = {
+            'url': url,
+            'etag': res.headers.get('ETag'),
+            'last_modified': res.headers.get('Last-Modified'),
+            'content_hash': digest.hexdigest()
+        }
+        with open(meta_path, 'w') as fh:
+            json.dump(meta, fh)
+        return Download(url, file_path, meta['content_hash'], False)
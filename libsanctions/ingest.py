@@ -0,0 +1,143 @@
+import json
+import logging
+from datetime import datetime
+from multiprocessing import Pool
+from sqlalchemy.sql import table, column
+from sqlalchemy.types import TypeDecorator
+
+from libsanctions.model import Entity, session, dispose_engine
+from libsanctions.metrics import metrics
+
+log = logging.getLogger(__name__)
+MODELS = [Entity] + [model for (_, model) in Entity.CHILDREN]
+_layouts = {}
+
+
+def _layout(model):
+    """Get the columns of rows prepared for ``model``, their normalisers
+    and an untyped insert target for them.
+
+    Values are normalised with the bind processing of the model's own
+    column types when the rows are prepared, so they are inserted
+    through a plain table clause which does not repeat that work."""
+    if model not in _layouts:
+        names = list(model.json_row({}).keys())
+        if model is Entity:
+            names.append('timestamp')
+        else:
+            names.extend(('entity_id', 'source'))
+        names = tuple(sorted(names))
+        normalisers, columns = [], []
+        for name in names:
+            type_ = model.__table__.c[name].type
+            if isinstance(type_, TypeDecorator):
+                normalisers.append(type_.process_bind_param)
+                type_ = type_.impl
+            else:
+                normalisers.append(None)
+            columns.append(column(name, type_))
+        target = table(model.__tablename__, *columns)
+        _layouts[model] = (names, tuple(normalisers), target)
+    return _layouts[model]
+
+
+def _make_row(model, row):
+    names, normalisers, _ = _layout(model)
+    values = []
+    for name, normalise in zip(names, normalisers):
+        value = row.get(name)
+        if normalise is not None:
+            value = normalise(value, None)
+        values.append(value)
+    return tuple(values)
+
+
+def prepare_rows(lines):
+    """Decode a chunk of ijson lines into normalised row tuples; see
+    ``prepare_entities``."""
+    return prepare_entities(json.loads(line.decode('utf-8'))
+                            for line in lines)
+
+
+def prepare_entities(items):
+    """Turn a chunk of JSON entities into normalised row tuples.
+
+    Returns a list of ``(model index, rows)`` in insert order, entities
+    first. This does not touch the database, so it can run in a worker
+    process."""
+    timestamp = datetime.utcnow()
+    rows = [[] for _ in MODELS]
+    for data in items:
+        row = Entity.json_row(data)
+        row['timestamp'] = timestamp
+        rows[0].append(_make_row(Entity, row))
+        for i, (key, model) in enumerate(Entity.CHILDREN, 1):
+            for subdata in data.get(key, []):
+                row = model.json_row(subdata)
+                row['entity_id'] = data.get('id')
+                row['source'] = data.get('source')
+                rows[i].append(_make_row(model, row))
+    return [(i, r) for (i, r) in enumerate(rows) if len(r)]
+
+
+@metrics.timed('bulk_insert')
+def insert_rows(prepared):
+    """Insert the output of ``prepare_rows`` or ``prepare_entities``;
+    returns the entity count."""
+    count = 0
+    for i, rows in prepared:
+        names, _, target = _layout(MODELS[i])
+        params = [dict(zip(names, row)) for row in rows]
+        session.execute(target.insert(), params)
+        if i == 0:
+            count = len(rows)
+    metrics.incr('entities_loaded', count)
+    return count
+
+
+class _Prepared(object):
+    # Stands in for an ``AsyncResult`` when rows are prepared in-thread.
+
+    def __init__(self, prepared):
+        self.prepared = prepared
+
+    def get(self):
+        return self.prepared
+
+
+class RowLoader(object):
+    """Prepare chunks of ijson lines for ``insert_rows``.
+
+    With ``processes`` above zero, decoding and normalisation run in a
+    pool of worker processes. ``submit`` returns at once with a handle
+    whose ``get()`` waits for the rows; writing the handles in submit
+    order keeps the rows in the order of the input.
+
+    The pool is forked when the loader is created. Pooled database
+    connections are closed first, so the workers do not inherit them;
+    the session must not hold one, i.e. it has to be committed."""
+
+    def __init__(self, processes=0):
+        self.processes = processes
+        self.pool = None
+        if processes > 0:
+            dispose_engine()
+            self.pool = Pool(processes)
+            log.info("Decoding in %s processes", processes)
+
+    def submit(self, lines):
+        if self.pool is None:
+            return _Prepared(prepare_rows(lines))
+        return self.pool.apply_async(prepare_rows, (lines,))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def terminate(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
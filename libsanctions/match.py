@@ -0,0 +1,226 @@
+import logging
+import numpy
+from normality import normalize
+
+from libsanctions.screen import iter_names
+
+log = logging.getLogger(__name__)
+NGRAM = 3
+# Most (query, candidate) n-gram pairs expanded at once; a batch which
+# would expand more is split. Each pair takes about 40 bytes of arrays.
+MAX_PAIRS = 1000000
+
+
+def make_ngrams(name, n=NGRAM):
+    """Get the set of character n-grams of a normalised, padded name."""
+    name = normalize(name, ascii=True)
+    if name is None:
+        return set()
+    name = ' %s ' % name
+    return set(name[i:i + n] for i in range(max(1, len(name) - n + 1)))
+
+
+class Matcher(object):
+    """Approximate name matching over all entity and alias names.
+
+    Candidates are blocked on shared character n-grams through an
+    inverted index held in NumPy arrays. They are scored with the Dice
+    coefficient of their n-gram sets, ``2 * shared / (a + b)``, for a
+    whole batch of query names at a time. N-grams which occur in more
+    than ``max_df`` names are too common to be useful for blocking, so
+    they do not make a name a candidate; the candidates are still scored
+    on all their n-grams."""
+
+    def __init__(self, names, max_df=5000):
+        self.max_df = max_df
+        self.pairs_scored = 0
+        self.vocab = {}
+        self.entity_ids = []
+        entity_index = {}
+        name_entities = []
+        name_sizes = []
+        postings = []
+        for entity_id, name in names:
+            grams = make_ngrams(name)
+            if not len(grams):
+                continue
+            if entity_id not in entity_index:
+                entity_index[entity_id] = len(self.entity_ids)
+                self.entity_ids.append(entity_id)
+            name_idx = len(name_entities)
+            name_entities.append(entity_index[entity_id])
+            name_sizes.append(len(grams))
+            for gram in grams:
+                gram_id = self.vocab.setdefault(gram, len(self.vocab))
+                postings.append((gram_id, name_idx))
+
+        self.name_entities = numpy.array(name_entities, dtype=numpy.int32)
+        self.name_sizes = numpy.array(name_sizes, dtype=numpy.float64)
+        postings = numpy.array(postings, dtype=numpy.int64).reshape(-1, 2)
+        # Inverted index in CSR layout: the names containing n-gram ``g``
+        # are ``indices[indptr[g]:indptr[g + 1]]``.
+        order = numpy.argsort(postings[:, 0], kind='mergesort')
+        grams = postings[order, 0]
+        self.indices = postings[order, 1].astype(numpy.int32)
+        counts = numpy.bincount(grams, minlength=len(self.vocab))
+        self.indptr = numpy.zeros(len(self.vocab) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=self.indptr[1:])
+        # The common n-grams of each name, also in CSR layout: those of
+        # name ``n`` are ``common_grams[common_indptr[n]:..[n + 1]]``.
+        common = (counts > max_df)[postings[:, 0]]
+        self.common_grams = postings[common, 0]
+        self.common_indptr = numpy.zeros(len(name_sizes) + 1,
+                                         dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(postings[common, 1],
+                                    minlength=len(name_sizes)),
+                     out=self.common_indptr[1:])
+        log.info("Matcher: %s names, %s n-grams", len(name_sizes),
+                 len(self.vocab))
+
+    @classmethod
+    def from_database(cls, **kwargs):
+        return cls(iter_names(), **kwargs)
+
+    def _query_grams(self, names):
+        """Map each query name to its known n-gram ids. Also returns
+        which of them are selective enough for blocking, and the number
+        of n-grams of each name."""
+        query_ids, gram_ids, sizes = [], [], []
+        for i, name in enumerate(names):
+            grams = make_ngrams(name)
+            sizes.append(len(grams))
+            for gram in grams:
+                gram_id = self.vocab.get(gram)
+                if gram_id is not None:
+                    query_ids.append(i)
+                    gram_ids.append(gram_id)
+        query_ids = numpy.array(query_ids, dtype=numpy.int64)
+        gram_ids = numpy.array(gram_ids, dtype=numpy.int64)
+        df = self.indptr[gram_ids + 1] - self.indptr[gram_ids]
+        selective = df <= self.max_df
+        sizes = numpy.array(sizes, dtype=numpy.float64)
+        return query_ids, gram_ids, selective, sizes
+
+    @staticmethod
+    def _expand(starts, lengths):
+        """Get the positions ``starts[i]:starts[i] + lengths[i]`` of all
+        ``i``, as one flat array."""
+        ends = numpy.cumsum(lengths)
+        offsets = numpy.arange(int(lengths.sum())) - \
+            numpy.repeat(ends - lengths, lengths)
+        return offsets + numpy.repeat(starts, lengths)
+
+    def _shared_common(self, queries, candidates, query_keys, max_pairs):
+        """Count the common n-grams each (query, candidate name) pair
+        shares. ``query_keys`` are the sorted ``query * len(vocab) +
+        gram`` keys of the common query n-grams. At most ``max_pairs``
+        candidate n-grams are expanded at a time."""
+        shared = numpy.zeros(len(queries), dtype=numpy.int64)
+        starts = self.common_indptr[candidates]
+        lengths = self.common_indptr[candidates + 1] - starts
+        ends = numpy.cumsum(lengths)
+        first = 0
+        while first < len(queries):
+            limit = ends[first] - lengths[first] + max_pairs
+            last = max(first + 1, int(numpy.searchsorted(ends, limit,
+                                                         side='right')))
+            part = slice(first, last)
+            grams = self.common_grams[self._expand(starts[part],
+                                                   lengths[part])]
+            keys = numpy.repeat(queries[part], lengths[part]) * \
+                len(self.vocab) + grams
+            found = numpy.searchsorted(query_keys, keys)
+            found[found == len(query_keys)] = 0
+            hits = query_keys[found] == keys
+            pair_ids = numpy.repeat(numpy.arange(last - first),
+                                    lengths[part])
+            shared[part] = numpy.bincount(pair_ids, weights=hits,
+                                          minlength=last - first)
+            first = last
+        return shared
+
+    def _score_batch(self, names, limit, threshold, max_pairs):
+        query_ids, gram_ids, selective, query_sizes = \
+            self._query_grams(names)
+        results = [[] for _ in names]
+        common_ids = query_ids[~selective]
+        common_keys = numpy.sort(common_ids * len(self.vocab) +
+                                 gram_ids[~selective])
+        common = numpy.bincount(common_ids, minlength=len(names))
+        query_ids, gram_ids = query_ids[selective], gram_ids[selective]
+        if not len(gram_ids):
+            return results
+
+        # Expand the posting lists of all query n-grams into one flat
+        # array of (query, candidate name) pairs.
+        starts = self.indptr[gram_ids]
+        lengths = self.indptr[gram_ids + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return results
+        if total > max_pairs and len(names) > 1:
+            half = len(names) // 2
+            return self._score_batch(names[:half], limit, threshold,
+                                     max_pairs) + \
+                self._score_batch(names[half:], limit, threshold, max_pairs)
+        candidates = self.indices[self._expand(starts, lengths)]
+        queries = numpy.repeat(query_ids, lengths)
+
+        # Each repeated pair is one shared selective n-gram. At best, a
+        # pair also shares all the common n-grams of the query, so those
+        # which can't reach ``threshold`` even then are dropped before
+        # their common n-grams are compared.
+        pairs = queries * len(self.name_sizes) + candidates
+        pairs, shared = numpy.unique(pairs, return_counts=True)
+        self.pairs_scored += len(pairs)
+        queries = pairs // len(self.name_sizes)
+        candidates = pairs % len(self.name_sizes)
+        sizes = query_sizes[queries] + self.name_sizes[candidates]
+        keep = 2.0 * (shared + common[queries]) / sizes >= threshold
+        queries, candidates = queries[keep], candidates[keep]
+        sizes, shared = sizes[keep], shared[keep]
+        if len(common_keys):
+            shared = shared + self._shared_common(queries, candidates,
+                                                  common_keys, max_pairs)
+        scores = 2.0 * shared / sizes
+        keep = scores >= threshold
+        queries = queries[keep]
+        entities = self.name_entities[candidates[keep]]
+        scores = scores[keep]
+
+        # Keep the best scoring name per (query, entity), then the top
+        # ``limit`` entities per query.
+        order = numpy.lexsort((-scores, entities, queries))
+        queries, entities = queries[order], entities[order]
+        scores = scores[order]
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = (queries[1:] != queries[:-1]) | \
+            (entities[1:] != entities[:-1])
+        queries, entities = queries[first], entities[first]
+        scores = scores[first]
+
+        order = numpy.lexsort((-scores, queries))
+        queries, entities = queries[order], entities[order]
+        scores = scores[order]
+        starts = numpy.searchsorted(queries, queries, side='left')
+        keep = numpy.arange(len(queries)) - starts < limit
+        for q, e, s in zip(queries[keep], entities[keep], scores[keep]):
+            results[q].append((self.entity_ids[e], float(s)))
+        return results
+
+    def match_many(self, names, limit=10, threshold=0.5, batch_size=1000,
+                   max_pairs=MAX_PAIRS):
+        """Match a list of names, returning a list of ``(entity_id,
+        score)`` lists, best first, in the order of ``names``. Batches
+        are split further so that no more than ``max_pairs`` n-gram
+        pairs are expanded at a time."""
+        names = list(names)
+        results = []
+        for i in range(0, len(names), batch_size):
+            batch = names[i:i + batch_size]
+            results.extend(self._score_batch(batch, limit, threshold,
+                                             max_pairs))
+        return results
+
+    def match(self, name, limit=10, threshold=0.5):
+        return self.match_many([name], limit=limit, threshold=threshold)[0]
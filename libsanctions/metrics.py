@@ -0,0 +1,111 @@
+import time
+import json
+import socket
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+from libsanctions.config import STATSD_HOST, STATSD_PORT
+
+log = logging.getLogger(__name__)
+
+
+class Metrics(object):
+    """Timers and counters for the stages of a scraper run.
+
+    Hooks are called as ``hook(kind, name, value)`` for every counter
+    increment (kind 'counter') and every timed call (kind 'timer', value
+    in seconds), e.g. to forward them to statsd."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _notify(self, kind, name, value):
+        for hook in self.hooks:
+            try:
+                hook(kind, name, value)
+            except Exception:
+                log.exception("Metrics hook failed: %r", hook)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._notify('counter', name, value)
+
+    def record(self, name, seconds):
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+        self._notify('timer', name, seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
+
+    def timed(self, name):
+        """Decorate a function so that every call is timed."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self):
+        with self.lock:
+            timers = {}
+            for name, (count, total, longest) in self.timers.items():
+                timers[name] = {
+                    'count': count,
+                    'total': total,
+                    'mean': total / count,
+                    'max': longest
+                }
+            return {'counters': dict(self.counters), 'timers': timers}
+
+    def write_report(self, file_path, **extra):
+        """Write the current report, plus ``extra`` fields, as JSON."""
+        report = self.report()
+        report.update(extra)
+        with open(file_path, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+        return report
+
+
+class StatsdSink(object):
+    """A metrics hook which sends to a statsd daemon over UDP."""
+
+    def __init__(self, host='localhost', port=8125, prefix='libsanctions'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, kind, name, value):
+        if kind == 'timer':
+            line = '%s.%s:%d|ms' % (self.prefix, name, value * 1000)
+        else:
+            line = '%s.%s:%d|c' % (self.prefix, name, value)
+        self.socket.sendto(line.encode('utf-8'), self.address)
+
+
+metrics = Metrics()
+if STATSD_HOST is not None:
+    metrics.add_hook(StatsdSink(STATSD_HOST, STATSD_PORT))
@@ -0,0 +1,203 @@
+import os
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+
+INDEX_SUFFIX = '.idx'
+MAGIC = b'LSIX'
+VERSION = 1
+# magic, version, number of entries
+HEADER = struct.Struct('<4sIQ')
+# offset and length of the line in the ijson file, then offset and
+# length of the entity id in the key block after the entries.
+ENTRY = struct.Struct('<QIQI')
+
+
+def _key(entity_id):
+    if not isinstance(entity_id, bytes):
+        entity_id = entity_id.encode('utf-8')
+    return entity_id
+
+
+class IndexWriter(object):
+    """Collect the position of each line of an ijson export, and write
+    them as an index sorted by entity id.
+
+    The index is a header, a table of fixed-size entries and a block of
+    entity ids, so an entry can be found by binary search without
+    reading the whole file (see ``IjsonReader``). Entries and ids are
+    kept in temporary files until ``close()``, and only read back into
+    memory to be sorted if they were not added in order."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.name = fh.name
+        self.entries = tempfile.TemporaryFile()
+        self.keys = tempfile.TemporaryFile()
+        self.count = 0
+        self.last_key = None
+        self.key_offset = 0
+        self.position = 0
+        self.ordered = True
+
+    def add(self, entity_id, length):
+        """Record a line of ``length`` bytes, not counting the newline,
+        written right after the previous one."""
+        key = _key(entity_id)
+        if self.ordered and self.last_key is not None and \
+                key <= self.last_key:
+            self.ordered = False
+        self.last_key = key
+        self.entries.write(ENTRY.pack(self.position, length,
+                                      self.key_offset, len(key)))
+        self.keys.write(key)
+        self.key_offset += len(key)
+        self.count += 1
+        self.position += length + 1
+
+    def _sort(self):
+        # The database may collate ids differently than a byte-wise
+        # comparison, which is what the reader searches by.
+        self.entries.seek(0)
+        entries = [ENTRY.unpack(self.entries.read(ENTRY.size))
+                   for i in range(self.count)]
+        self.keys.seek(0)
+        keys = self.keys.read()
+        entries.sort(key=lambda e: keys[e[2]:e[2] + e[3]])
+        self.entries.seek(0)
+        self.keys.seek(0)
+        key_offset = 0
+        for offset, length, start, key_length in entries:
+            self.entries.write(ENTRY.pack(offset, length, key_offset,
+                                          key_length))
+            self.keys.write(keys[start:start + key_length])
+            key_offset += key_length
+
+    def close(self):
+        if not self.ordered:
+            self._sort()
+        self.fh.write(HEADER.pack(MAGIC, VERSION, self.count))
+        for data in (self.entries, self.keys):
+            data.seek(0)
+            shutil.copyfileobj(data, self.fh)
+            data.close()
+        self.fh.close()
+
+    def abort(self):
+        self.entries.close()
+        self.keys.close()
+        if hasattr(self.fh, 'abort'):
+            self.fh.abort()
+        else:
+            self.fh.close()
+
+
+def _map(file_path):
+    with open(file_path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IjsonReader(object):
+    """Random access into an uncompressed ijson export and its index.
+
+    Both files are memory-mapped, so a lookup by id is a binary search
+    over the index which only touches the pages it needs, followed by
+    one slice of the export."""
+
+    def __init__(self, file_path, index_path=None):
+        self.file_path = file_path
+        if index_path is None:
+            index_path = file_path + INDEX_SUFFIX
+        self.data = _map(file_path)
+        self.index = _map(index_path)
+        if self.index is None:
+            raise ValueError("Empty index: %s" % index_path)
+        magic, version, self.count = HEADER.unpack_from(self.index, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not an ijson index: %s" % index_path)
+        self.keys_start = HEADER.size + self.count * ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self.index, HEADER.size + i * ENTRY.size)
+
+    def _key_at(self, entry):
+        start = self.keys_start + entry[2]
+        return self.index[start:start + entry[3]]
+
+    def locate(self, entity_id):
+        """Get the ``(offset, length)`` of an entity's line in the
+        export, or None if it is not in the index."""
+        key = _key(entity_id)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            entry = self._entry(mid)
+            found = self._key_at(entry)
+            if found < key:
+                low = mid + 1
+            elif found > key:
+                high = mid
+            else:
+                return entry[0], entry[1]
+
+    def get_raw(self, entity_id):
+        """Get the JSON line of an entity, undecoded, or None."""
+        position = self.locate(entity_id)
+        if position is not None:
+            offset, length = position
+            return self.data[offset:offset + length]
+
+    def get(self, entity_id):
+        line = self.get_raw(entity_id)
+        if line is not None:
+            return json.loads(line.decode('utf-8'))
+
+    def __contains__(self, entity_id):
+        return self.locate(entity_id) is not None
+
+    def ids(self):
+        """Yield the ids in the index in sorted order."""
+        for i in range(self.count):
+            yield self._key_at(self._entry(i)).decode('utf-8')
+
+    def shards(self, shard_size):
+        """Split the export into ``(start, end)`` byte ranges of about
+        ``shard_size`` bytes each, ending on line boundaries, for
+        consumers which each read one of them (``iter_shard``)."""
+        ranges = []
+        size = 0 if self.data is None else len(self.data)
+        start = 0
+        while start < size:
+            end = self.data.find(b'\n', min(start + shard_size, size) - 1)
+            end = size if end == -1 else end + 1
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    def iter_shard(self, start, end):
+        """Yield the entities in a byte range returned by ``shards``."""
+        while start < end:
+            stop = self.data.find(b'\n', start, end)
+            stop = end if stop == -1 else stop
+            line = self.data[start:stop]
+            if len(line.strip()):
+                yield json.loads(line.decode('utf-8'))
+            start = stop + 1
+
+    def close(self):
+        for mapped in (self.data, self.index):
+            if mapped is not None:
+                mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,218 @@
+import re
+import logging
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import bindparam, select, func
+
+from libsanctions.model import session, Entity, Identifier, BirthDate
+from libsanctions.model import NameKey
+from libsanctions.metrics import metrics
+
+log = logging.getLogger(__name__)
+# Blocks with more members than this are keys shared by too many
+# unrelated entities (common names) and are not compared at all.
+MAX_BLOCK = 50
+UPDATE_CHUNK = 10000
+NON_ALNUM = re.compile(r'[^0-9A-Z]+')
+# Characters which are removed from identifier numbers in the database
+# to sort them into blocks. Numbers which differ by others are not
+# compared.
+SEPARATORS = (' ', '-', '.', '/', ',', ':', '_', '#', '(', ')')
+
+
+class UnionFind(object):
+    """Disjoint sets over the integers ``0..size-1``. With ``labels``, a
+    label for each integer, two sets are only joined if no label is in
+    both of them."""
+
+    def __init__(self, size, labels=None):
+        self.parent = list(range(size))
+        self.labels = labels
+        # The labels of each set of more than one member, by its root.
+        self.set_labels = {}
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            # Path halving keeps the trees flat.
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _labels(self, root):
+        labels = self.set_labels.get(root)
+        if labels is None:
+            labels = set([self.labels[root]])
+        return labels
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        root, child = min(a, b), max(a, b)
+        if self.labels is not None:
+            labels, other = self._labels(root), self._labels(child)
+            if not labels.isdisjoint(other):
+                return False
+            labels.update(other)
+            self.set_labels[root] = labels
+            self.set_labels.pop(child, None)
+        self.parent[child] = root
+        return True
+
+
+class Resolver(object):
+    """Cluster the entities of different sources which describe the same
+    person or organisation.
+
+    Candidates are blocked on a shared identifier number and country, or
+    on a shared name fingerprint (from the name index). Two candidates
+    are merged if they come from different sources, their types do not
+    differ and, where both have birth dates, they share one. A cluster
+    never holds two entities of the same source, even through others. A shared
+    name alone is too weak for individuals: they also need to share a
+    birth date. Only pairs within a block are compared, so the work
+    grows with the number of name and identifier rows rather than with
+    the square of the entity count."""
+
+    def __init__(self, max_block=MAX_BLOCK):
+        self.max_block = max_block
+        self.ids = []
+        self.index = {}
+        self.sources = []
+        self.types = []
+        self.birth_dates = {}
+        self.merges = 0
+
+    def _rows(self, query):
+        # Stream the rows rather than have the driver buffer them all.
+        query = query.execution_options(stream_results=True)
+        return session.execute(query)
+
+    def load(self):
+        source_ids = {}
+        table = Entity.__table__
+        q = select([table.c.id, table.c.source, table.c.type])
+        for entity_id, source, type_ in self._rows(q):
+            self.index[entity_id] = len(self.ids)
+            self.ids.append(entity_id)
+            self.sources.append(source_ids.setdefault(source,
+                                                      len(source_ids)))
+            self.types.append(type_ or None)
+        table = BirthDate.__table__
+        q = select([table.c.entity_id, table.c.date])
+        q = q.where(table.c.date.isnot(None))
+        for entity_id, date in self._rows(q):
+            i = self.index.get(entity_id)
+            if i is not None:
+                self.birth_dates.setdefault(i, set()).add(date)
+        self.sets = UnionFind(len(self.ids), labels=self.sources)
+
+    def compatible(self, a, b, strong):
+        if self.sources[a] == self.sources[b]:
+            return False
+        type_a, type_b = self.types[a], self.types[b]
+        if type_a is not None and type_b is not None and type_a != type_b:
+            return False
+        dates_a = self.birth_dates.get(a)
+        dates_b = self.birth_dates.get(b)
+        if dates_a and dates_b:
+            return not dates_a.isdisjoint(dates_b)
+        individual = Entity.TYPE_INDIVIDUAL
+        return strong or (type_a != individual and type_b != individual)
+
+    def merge_block(self, members, strong=False):
+        """Merge the compatible members of a block; ``strong`` blocks
+        are keys which identify an individual on their own."""
+        members = sorted(set(members))
+        if len(members) < 2:
+            return
+        if len(members) > self.max_block:
+            metrics.incr('resolve_blocks_skipped')
+            return
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if self.compatible(a, b, strong) and self.sets.union(a, b):
+                    self.merges += 1
+
+    def block_names(self):
+        # The name index is sorted on its fingerprint column, so each
+        # block is read in one piece and then dropped again.
+        table = NameKey.__table__
+        q = select([table.c.fingerprint, table.c.entity_id])
+        q = q.order_by(table.c.fingerprint)
+        index = self.index
+        for fp, rows in groupby(self._rows(q), key=itemgetter(0)):
+            self.merge_block([index[e] for (_, e) in rows if e in index])
+
+    def block_identifiers(self):
+        # Numbers are sorted on a key with the usual separators removed,
+        # so that numbers which only differ by those are read together;
+        # within those, blocks are on the fully normalised number.
+        table = Identifier.__table__
+        key = table.c.number
+        for separator in SEPARATORS:
+            key = func.replace(key, separator, '')
+        key = func.upper(key)
+        q = select([key, table.c.country_code, table.c.number,
+                    table.c.entity_id])
+        q = q.where(table.c.number.isnot(None))
+        q = q.order_by(key, table.c.country_code)
+        index = self.index
+        for _, rows in groupby(self._rows(q), key=itemgetter(0, 1)):
+            blocks = {}
+            for _, _, number, entity_id in rows:
+                number = NON_ALNUM.sub('', number.upper())
+                i = index.get(entity_id)
+                if len(number) and i is not None:
+                    blocks.setdefault(number, []).append(i)
+            for members in blocks.values():
+                self.merge_block(members, strong=True)
+
+    def clusters(self):
+        """Get the member ids of each cluster of more than one entity."""
+        find = self.sets.find
+        roots = set(find(i) for i in range(len(self.ids)) if find(i) != i)
+        clusters = {}
+        for i, entity_id in enumerate(self.ids):
+            root = find(i)
+            if root in roots:
+                clusters.setdefault(root, []).append(entity_id)
+        return list(clusters.values())
+
+    def run(self):
+        self.load()
+        self.block_identifiers()
+        self.block_names()
+        return self.clusters()
+
+
+@metrics.timed('resolve')
+def resolve_entities(max_block=MAX_BLOCK):
+    """Cluster matching entities across sources, and store the id of each
+    cluster as the ``canonical_id`` of its members. Entities which match
+    nothing keep an empty ``canonical_id``."""
+    resolver = Resolver(max_block=max_block)
+    clusters = resolver.run()
+    table = Entity.__table__
+    session.execute(table.update().values(canonical_id=None))
+    stmt = table.update().where(table.c.id == bindparam('_id'))
+    stmt = stmt.values(canonical_id=bindparam('_canonical_id'))
+    rows = []
+    for members in clusters:
+        # The smallest member id stays the same for as long as that
+        # entity is part of the cluster.
+        canonical_id = min(members)
+        for entity_id in members:
+            rows.append({'_id': entity_id, '_canonical_id': canonical_id})
+        if len(rows) >= UPDATE_CHUNK:
+            session.execute(stmt, rows)
+            rows = []
+    if len(rows):
+        session.execute(stmt, rows)
+    session.commit()
+    merged = sum(len(m) for m in clusters)
+    metrics.incr('resolve_clusters', len(clusters))
+    metrics.incr('resolve_entities', merged)
+    log.info("Resolved %s entities into %s clusters", merged, len(clusters))
+    return clusters
@@ -0,0 +1,91 @@
+import logging
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import select, union_all
+
+from libsanctions.model import session, Entity, Alias, NameKey, NameMixIn
+
+log = logging.getLogger(__name__)
+QUERY_CHUNK = 500
+INSERT_CHUNK = 10000
+
+
+def iter_names():
+    """Yield ``(entity_id, name)`` for all entity and alias names, in the
+    order of the entity ids."""
+    selects = []
+    for model, id_column in ((Entity, Entity.__table__.c.id),
+                             (Alias, Alias.__table__.c.entity_id)):
+        table = model.__table__
+        columns = [table.c[n] for n in NameMixIn.NAME_COLUMNS]
+        selects.append(select([id_column.label('entity_id')] + columns))
+    names = union_all(*selects).alias('names')
+    q = session.query(names).order_by(names.c.entity_id)
+    for row in q.yield_per(10000):
+        yield row[0], NameMixIn.compose_name(*row[1:])
+
+
+def build_name_index():
+    """Rebuild the fingerprint index over all entity and alias names. The
+    names are read one entity at a time, so only the fingerprints of that
+    entity and a chunk of rows to insert are held in memory."""
+    import fingerprints
+    table = NameKey.__table__
+    session.execute(table.delete())
+    count = 0
+    rows = []
+    for entity_id, names in groupby(iter_names(), key=itemgetter(0)):
+        fps = set(fingerprints.generate(name) for (_, name) in names)
+        fps.discard(None)
+        for fp in fps:
+            rows.append({'fingerprint': fp, 'entity_id': entity_id})
+        if len(rows) >= INSERT_CHUNK:
+            session.execute(table.insert(), rows)
+            count += len(rows)
+            rows = []
+    if len(rows):
+        session.execute(table.insert(), rows)
+        count += len(rows)
+    session.commit()
+    log.info("Indexed %s name fingerprints", count)
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), QUERY_CHUNK):
+        yield items[i:i + QUERY_CHUNK]
+
+
+def screen_many(names, session=session):
+    """Screen a list of names against the name index. Returns a dict which
+    maps each name to the list of entities with a matching fingerprint.
+    The queries run on ``session``, the shared scoped session by
+    default."""
+    import fingerprints
+    keys = dict((name, fingerprints.generate(name)) for name in names)
+    matches = dict((fp, set()) for fp in keys.values() if fp is not None)
+
+    for fps in _chunks(matches.keys()):
+        q = session.query(NameKey.fingerprint, NameKey.entity_id)
+        for fp, entity_id in q.filter(NameKey.fingerprint.in_(fps)):
+            matches[fp].add(entity_id)
+
+    entities = {}
+    entity_ids = set()
+    for ids in matches.values():
+        entity_ids.update(ids)
+    for ids in _chunks(entity_ids):
+        for entity in session.query(Entity).filter(Entity.id.in_(ids)):
+            entities[entity.id] = entity
+
+    results = {}
+    for name, fp in keys.items():
+        ids = matches.get(fp, ())
+        results[name] = [entities[i] for i in sorted(ids) if i in entities]
+    return results
+
+
+def screen(name):
+    """Find the entities which carry ``name``, or a variant of it which
+    has the same fingerprint."""
+    return screen_many([name]).get(name, [])
@@ -0,0 +1,333 @@
+"""An HTTP service for entity lookups and name screening.
+
+    python -m libsanctions.service --port 8080
+
+    GET /entities/<id>           the entity, with all its child records
+    GET /screen?name=..&name=..  the entities matching each name
+
+Each request thread hands its keys to a ``Batcher``, which answers the
+keys of all concurrent requests with one query on a fixed pool of
+connections. Results are cached for ``SERVICE_CACHE_TTL`` seconds. The
+cache is dropped when a ``Source.finish()`` in any process has recorded
+a new ``Run``, which is checked every ``SERVICE_CHECK_INTERVAL``
+seconds.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import urlparse, parse_qs, unquote
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from libsanctions.config import database_uri, SERVICE_WORKERS
+from libsanctions.config import SERVICE_BATCH_WINDOW
+from libsanctions.config import SERVICE_CACHE_TTL, SERVICE_CACHE_SIZE
+from libsanctions.config import SERVICE_CHECK_INTERVAL
+from libsanctions.cache import TTLCache
+from libsanctions.export import load_children
+from libsanctions.metrics import metrics
+from libsanctions.model import Entity, Run
+from libsanctions.screen import screen_many, QUERY_CHUNK
+
+log = logging.getLogger(__name__)
+MISSING = object()
+
+
+class _Waiter(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Batcher(object):
+    """Answer the keys requested by concurrent callers with one call of
+    ``func(keys)``, which returns a dict of results by key.
+
+    A batch is started on ``pool`` once one of the ``slots`` is free. It
+    takes the keys which arrive within ``window`` seconds, up to
+    ``max_size`` of them. While all slots are busy, requests pile up and
+    are answered in larger batches."""
+
+    def __init__(self, func, pool, slots, window=SERVICE_BATCH_WINDOW,
+                 max_size=QUERY_CHUNK):
+        self.func = func
+        self.pool = pool
+        self.slots = slots
+        self.window = window
+        self.max_size = max_size
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._dispatch)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def get_many(self, keys):
+        waiters = {}
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("Batcher is closed")
+            for key in keys:
+                if key not in self.pending:
+                    self.pending[key] = _Waiter()
+                waiters[key] = self.pending[key]
+            self.cond.notify()
+        results = {}
+        for key, waiter in waiters.items():
+            waiter.done.wait()
+            if waiter.error is not None:
+                raise waiter.error
+            results[key] = waiter.value
+        return results
+
+    def get(self, key):
+        return self.get_many([key])[key]
+
+    def close(self):
+        """Stop taking keys, dispatch the pending ones and wait for the
+        dispatcher thread to end. The batches still have to be waited
+        for on the pool."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _dispatch(self):
+        while True:
+            with self.cond:
+                while not len(self.pending) and not self.closed:
+                    self.cond.wait()
+                if not len(self.pending):
+                    return
+            self.slots.acquire()
+            deadline = time.time() + self.window
+            with self.cond:
+                while len(self.pending) < self.max_size and \
+                        not self.closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = []
+                while len(self.pending) and len(batch) < self.max_size:
+                    batch.append(self.pending.popitem(last=False))
+            self.pool.apply_async(self._run, (batch,))
+
+    def _run(self, batch):
+        results, error = {}, None
+        try:
+            results = self.func([key for (key, _) in batch])
+        except Exception as exc:
+            log.exception("Batch of %s keys failed", len(batch))
+            error = exc
+        finally:
+            self.slots.release()
+        metrics.incr('service_batches')
+        metrics.incr('service_batch_keys', len(batch))
+        for key, waiter in batch:
+            waiter.value = results.get(key)
+            waiter.error = error
+            waiter.done.set()
+
+
+class Service(object):
+    """Entity lookups and name screening on ``workers`` database
+    connections, in batches of up to ``batch_size`` keys, with a cache
+    of recent results. The cache is dropped once a new ``Run`` is found
+    in the database, at most ``check_interval`` seconds after it."""
+
+    def __init__(self, uri=None, workers=SERVICE_WORKERS,
+                 window=SERVICE_BATCH_WINDOW, batch_size=QUERY_CHUNK,
+                 cache_ttl=SERVICE_CACHE_TTL, cache_size=SERVICE_CACHE_SIZE,
+                 check_interval=SERVICE_CHECK_INTERVAL):
+        uri = uri or database_uri()
+        connect_args = {}
+        if make_url(uri).get_backend_name() == 'sqlite':
+            # The pooled connections are used by more than one thread.
+            connect_args['check_same_thread'] = False
+        self.engine = create_engine(uri, poolclass=QueuePool,
+                                    pool_size=workers, max_overflow=0,
+                                    connect_args=connect_args)
+        self.sessions = scoped_session(sessionmaker(bind=self.engine))
+        self.pool = ThreadPool(workers)
+        slots = threading.Semaphore(workers)
+        self.entities = Batcher(self._load_entities, self.pool, slots,
+                                window=window, max_size=batch_size)
+        self.screens = Batcher(self._screen_names, self.pool, slots,
+                               window=window, max_size=batch_size)
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.generation = 0
+        self.check_interval = check_interval
+        self.check_lock = threading.Lock()
+        self.next_check = time.time() + check_interval
+        Run.__table__.create(self.engine, checkfirst=True)
+        self.last_run = self._last_run()
+
+    def _load_entities(self, entity_ids):
+        session = self.sessions()
+        try:
+            q = session.query(Entity).filter(Entity.id.in_(entity_ids))
+            entities = q.all()
+            load_children(entities, session=session)
+            return dict((e.id, e.to_json()) for e in entities)
+        finally:
+            self.sessions.remove()
+
+    def _screen_names(self, names):
+        session = self.sessions()
+        try:
+            results = screen_many(names, session=session)
+            entities = {}
+            for matches in results.values():
+                for entity in matches:
+                    entities[entity.id] = entity
+            entities = list(entities.values())
+            # The same JSON as a lookup, with the child records.
+            for i in range(0, len(entities), QUERY_CHUNK):
+                load_children(entities[i:i + QUERY_CHUNK], session=session)
+            return dict((name, [e.to_json() for e in matches])
+                        for (name, matches) in results.items())
+        finally:
+            self.sessions.remove()
+
+    def _last_run(self):
+        table = Run.__table__
+        with self.engine.connect() as conn:
+            return conn.scalar(select([func.max(table.c.finished_at)]))
+
+    def check_runs(self):
+        """Drop the cache if a source has finished a run since the last
+        check, unless that was less than ``check_interval`` ago."""
+        now = time.time()
+        with self.check_lock:
+            if now < self.next_check:
+                return
+            self.next_check = now + self.check_interval
+        last_run = self._last_run()
+        if last_run != self.last_run:
+            self.last_run = last_run
+            self.invalidate()
+
+    def _cached(self, kind, batcher, keys):
+        self.check_runs()
+        results, missing = {}, []
+        for key in keys:
+            value = self.cache.get((kind, key), MISSING)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                results[key] = value
+        if len(missing):
+            generation = self.generation
+            fetched = batcher.get_many(missing)
+            # Don't cache what was read before the data changed.
+            if generation == self.generation:
+                for key, value in fetched.items():
+                    self.cache.set((kind, key), value)
+            results.update(fetched)
+        return results
+
+    def lookup(self, entity_id):
+        """Get the JSON of an entity, or None."""
+        return self._cached('entity', self.entities, [entity_id])[entity_id]
+
+    def screen_many(self, names):
+        """Get the JSON of the entities matching each name."""
+        return self._cached('screen', self.screens, names)
+
+    def invalidate(self):
+        self.generation += 1
+        self.cache.clear()
+        log.info("Service cache cleared")
+
+    def close(self):
+        for batcher in (self.entities, self.screens):
+            batcher.close()
+        self.pool.close()
+        self.pool.join()
+        self.engine.dispose()
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return value
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests.
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        try:
+            if url.path.startswith('/entities/'):
+                entity_id = _text(unquote(url.path[len('/entities/'):]))
+                data = service.lookup(entity_id)
+                if data is None:
+                    return self.send_json(404, {'error': 'Not found'})
+                return self.send_json(200, data)
+            if url.path == '/screen':
+                names = [_text(n) for n in parse_qs(url.query).get('name', [])]
+                if not len(names):
+                    return self.send_json(400, {'error': 'No name given'})
+                return self.send_json(200,
+                                      {'results': service.screen_many(names)})
+        except Exception:
+            log.exception("Request failed: %s", self.path)
+            return self.send_json(500, {'error': 'Internal error'})
+        self.send_json(404, {'error': 'Not found'})
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, ServiceHandler)
+        self.service = service
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS)
+    args = parser.parse_args(argv)
+    service = Service(workers=args.workers)
+    server = ServiceServer((args.host, args.port), service)
+    log.info("Serving on http://%s:%s/", args.host, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
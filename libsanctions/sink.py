@@ -0,0 +1,210 @@
+import os
+import bz2
+import zlib
+import logging
+import six
+
+try:
+    import lzma
+except ImportError:  # Python 2
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+log = logging.getLogger(__name__)
+
+# S3 requires all parts of a multipart upload but the last to be at
+# least 5MB.
+PART_SIZE = 8 * 1024 * 1024
+# File extension and mime type of each compression.
+FORMATS = {
+    'gzip': ('.gz', 'application/gzip'),
+    'bz2': ('.bz2', 'application/x-bzip2')
+}
+if lzma is not None:
+    FORMATS['lzma'] = ('.xz', 'application/x-xz')
+# Key of the compression used for exports which are not named.
+DEFAULT = '*'
+
+
+def make_compressor(compression):
+    if compression == 'gzip':
+        return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Compressor()
+    if compression == 'lzma' and lzma is not None:
+        return lzma.LZMACompressor()
+    raise ValueError("Unknown compression: %r" % compression)
+
+
+def parse_compression(value):
+    """Parse a setting like ``gzip`` or ``gzip,snapshot=none`` into a
+    dict of the compression of each export, with the one of all others
+    under ``DEFAULT``. ``none`` leaves an export uncompressed."""
+    compression = {}
+    for part in (value or '').split(','):
+        name, _, codec = part.strip().rpartition('=')
+        codec = codec.strip().lower()
+        if not len(codec):
+            continue
+        compression[name.strip() or DEFAULT] = \
+            None if codec == 'none' else codec
+    return compression
+
+
+def compression_for(compression, name):
+    """Get the compression of the export ``name``. ``compression`` is a
+    codec for all exports, a dict as returned by ``parse_compression``,
+    or None."""
+    if isinstance(compression, dict):
+        return compression.get(name, compression.get(DEFAULT))
+    return compression
+
+
+def check_compression(compression, names):
+    """Fail before exporting anything if one of the exports ``names``
+    would use an unknown or unavailable compression."""
+    for name in names:
+        codec = compression_for(compression, name)
+        if codec is not None and codec not in FORMATS:
+            raise ValueError("Unknown compression for %s: %r" %
+                             (name, codec))
+
+
+class MultipartUpload(object):
+    """Upload a file to a ``morphium.Archive`` in parts, using the same
+    key layout as ``Archive.upload_file``."""
+
+    def __init__(self, archive, file_name, mime_type):
+        self.archive = archive
+        self.client = archive.client
+        self.key_name = os.path.join(archive.prefix, archive.tag, file_name)
+        from morphium.util import TAG_LATEST
+        self.copy_name = os.path.join(archive.prefix, TAG_LATEST, file_name)
+        self.args = {
+            'ContentType': mime_type,
+            'ACL': 'public-read'
+        }
+        log.info("Uploading [%s]: %s", archive.bucket, self.key_name)
+        res = self.client.create_multipart_upload(Bucket=archive.bucket,
+                                                  Key=self.key_name,
+                                                  **self.args)
+        self.upload_id = res['UploadId']
+        self.parts = []
+
+    def upload_part(self, data):
+        number = len(self.parts) + 1
+        res = self.client.upload_part(Bucket=self.archive.bucket,
+                                      Key=self.key_name,
+                                      UploadId=self.upload_id,
+                                      PartNumber=number,
+                                      Body=data)
+        self.parts.append({'PartNumber': number, 'ETag': res['ETag']})
+
+    def complete(self):
+        bucket = self.archive.bucket
+        self.client.complete_multipart_upload(
+            Bucket=bucket, Key=self.key_name, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts})
+        copy_source = {'Key': self.key_name, 'Bucket': bucket}
+        self.client.copy(copy_source, bucket, self.copy_name,
+                         ExtraArgs=self.args)
+        return 'http://%s/%s' % (bucket, self.key_name)
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.archive.bucket,
+                                           Key=self.key_name,
+                                           UploadId=self.upload_id)
+
+
+class LocalFile(object):
+    """Keep the compressed file locally if the archive is not configured,
+    like ``Archive.upload_file`` does."""
+
+    def __init__(self, file_path):
+        self.fh = open(file_path, 'wb')
+
+    def upload_part(self, data):
+        self.fh.write(data)
+
+    def complete(self):
+        self.fh.close()
+
+    def abort(self):
+        self.fh.close()
+
+
+class ExportSink(object):
+    """A write-only file object which compresses an export on the fly and
+    uploads it in parts, so no full-size file is kept on disk."""
+
+    def __init__(self, archive, file_name, export_path, compression='gzip',
+                 part_size=PART_SIZE):
+        if compression not in FORMATS:
+            raise ValueError("Unknown compression: %r" % compression)
+        extension, mime_type = FORMATS[compression]
+        self.name = file_name + extension
+        self.compressor = make_compressor(compression)
+        self.part_size = part_size
+        self.buffer = []
+        self.buffered = 0
+        self.bytes_written = 0
+        self.bytes_compressed = 0
+        self.url = None
+        if archive.client is None:
+            file_path = os.path.join(export_path, self.name)
+            self.upload = LocalFile(file_path)
+        else:
+            self.upload = MultipartUpload(archive, self.name, mime_type)
+
+    @property
+    def ratio(self):
+        """Compressed size as a fraction of the written size."""
+        if self.bytes_written == 0:
+            return 0.0
+        return self.bytes_compressed / float(self.bytes_written)
+
+    def tell(self):
+        return self.bytes_written
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        self.bytes_written += len(data)
+        self._buffer(self.compressor.compress(data))
+
+    def _buffer(self, data):
+        if len(data):
+            self.buffer.append(data)
+            self.buffered += len(data)
+            self.bytes_compressed += len(data)
+        if self.buffered >= self.part_size:
+            self._send()
+
+    def _send(self):
+        if len(self.buffer):
+            self.upload.upload_part(b''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        self._buffer(self.compressor.flush())
+        self._send()
+        self.url = self.upload.complete()
+        log.info("Exported %s: %s bytes, %s compressed (%.1f%%)",
+                 self.name, self.bytes_written, self.bytes_compressed,
+                 self.ratio * 100)
+        return self.url
+
+    def abort(self):
+        self.upload.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
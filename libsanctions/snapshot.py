@@ -0,0 +1,275 @@
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import six
+from collections import OrderedDict
+
+from libsanctions.util import clean_obj
+
+# File layout: MAGIC, the string table (uint64 offsets, then the UTF-8
+# data), one uint32 array per table column, and a JSON footer describing
+# where everything is. The last eight bytes hold the footer offset. All
+# integers are little-endian; string id 0 stands for None.
+MAGIC = b'LSNAP001'
+# Values kept for interning; the table is started over once it is full,
+# so a value which comes up again after that is stored twice.
+INTERN_SIZE = 100000
+
+
+class _Column(object):
+    # Integers in a temporary file, packed as ``<I`` or ``<Q``.
+
+    def __init__(self, code='I'):
+        self.code = code
+        self.fh = tempfile.TemporaryFile()
+        self.buffer = []
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= 4096:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer):
+            fmt = '<%d%s' % (len(self.buffer), self.code)
+            self.fh.write(struct.pack(fmt, *self.buffer))
+            self.buffer = []
+
+    def copy(self, fh):
+        self.flush()
+        self.fh.seek(0)
+        shutil.copyfileobj(self.fh, fh)
+
+    def close(self):
+        self.fh.close()
+
+
+class SnapshotWriter(object):
+    """Build a snapshot while the entities and child records are read.
+
+    Values are interned and appended to temporary column files as rows
+    are added, so only the intern table is held in memory. Entities have
+    to be added in the byte order of their UTF-8 ids, which is what
+    ``Snapshot.get`` searches by, and child records grouped by entity in
+    the same order."""
+
+    def __init__(self, intern_size=INTERN_SIZE):
+        self.intern_size = intern_size
+        self.strings = {}
+        self.string_count = 0
+        self.string_end = 0
+        self.string_data = tempfile.TemporaryFile()
+        self.columns = []
+        self.string_ends = self._column('Q')
+        self.entities = None
+        self.children = []
+
+    def _column(self, code='I'):
+        column = _Column(code)
+        self.columns.append(column)
+        return column
+
+    def intern(self, value):
+        """Get the string table id of ``value``."""
+        if value is None:
+            return 0
+        if not isinstance(value, six.text_type):
+            value = six.text_type(value)
+        idx = self.strings.get(value)
+        if idx is None:
+            if len(self.strings) >= self.intern_size:
+                self.strings = {}
+            data = value.encode('utf-8')
+            self.string_data.write(data)
+            self.string_end += len(data)
+            self.string_ends.append(self.string_end)
+            self.string_count += 1
+            idx = self.strings[value] = self.string_count
+        return idx
+
+    def add_entities(self, fields, rows):
+        """Add the entity rows, lists of values in the order of
+        ``fields``, sorted by id. Returns the number of entities."""
+        id_field = fields.index('id')
+        columns = [self._column() for _ in fields]
+        count, last = 0, None
+        for row in rows:
+            key = row[id_field].encode('utf-8')
+            if last is not None and key <= last:
+                raise ValueError("Entities are not sorted by id: %r" %
+                                 row[id_field])
+            last = key
+            for column, value in zip(columns, row):
+                column.append(self.intern(value))
+            count += 1
+        self.entities = (fields, columns, count)
+        return count
+
+    def add_children(self, key, fields, rows):
+        """Add the child records stored under ``key``, as ``(parent,
+        row)`` pairs where ``parent`` is the position of the record's
+        entity. Records have to come in the order of their entities."""
+        columns = [self._column() for _ in fields]
+        starts = self._column()
+        count, next_parent = 0, 0
+        for parent, row in rows:
+            if parent < next_parent - 1:
+                raise ValueError("Child records are not grouped by entity")
+            while next_parent <= parent:
+                starts.append(count)
+                next_parent += 1
+            for column, value in zip(columns, row):
+                column.append(self.intern(value))
+            count += 1
+        while next_parent <= self.entities[2]:
+            starts.append(count)
+            next_parent += 1
+        self.children.append((key, fields, columns, count, starts))
+
+    def _write_table(self, fh, fields, columns, count):
+        offsets = OrderedDict()
+        for field, column in zip(fields, columns):
+            offsets[field] = fh.tell()
+            column.copy(fh)
+        return {'fields': fields, 'count': count, 'columns': offsets}
+
+    def write(self, fh):
+        """Write the snapshot to a binary file object."""
+        fields, columns, count = self.entities
+        layout = {'strings': self.string_count, 'children': []}
+        fh.write(MAGIC)
+        layout['string_offsets'] = fh.tell()
+        fh.write(struct.pack('<Q', 0))
+        self.string_ends.copy(fh)
+        layout['string_data'] = fh.tell()
+        self.string_data.seek(0)
+        shutil.copyfileobj(self.string_data, fh)
+
+        layout['entities'] = self._write_table(fh, fields, columns, count)
+        for key, fields, columns, count, starts in self.children:
+            meta = self._write_table(fh, fields, columns, count)
+            meta['starts'] = fh.tell()
+            starts.copy(fh)
+            meta['key'] = key
+            layout['children'].append(meta)
+
+        footer = fh.tell()
+        fh.write(json.dumps(layout).encode('utf-8'))
+        fh.write(struct.pack('<Q', footer))
+
+    def close(self):
+        """Remove the temporary files."""
+        self.string_data.close()
+        for column in self.columns:
+            column.close()
+
+
+class Snapshot(object):
+    """A read-only, memory-mapped snapshot of the consolidated list.
+
+    The file pages are shared by all processes which open the same
+    snapshot. Records are only decoded when they are accessed."""
+
+    def __init__(self, file_path):
+        self.fh = open(file_path, 'rb')
+        self.data = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a snapshot file: %s" % file_path)
+        size = len(self.data)
+        footer, = struct.unpack_from('<Q', self.data, size - 8)
+        layout = self.data[footer:size - 8].decode('utf-8')
+        self.layout = json.loads(layout, object_pairs_hook=OrderedDict)
+        self.entities = self.layout['entities']
+        self.children = OrderedDict()
+        for meta in self.layout['children']:
+            self.children[meta['key']] = meta
+
+    def _int(self, offset, i):
+        return struct.unpack_from('<I', self.data, offset + 4 * i)[0]
+
+    def _bytes(self, idx):
+        if idx == 0:
+            return None
+        offset = self.layout['string_offsets'] + 8 * (idx - 1)
+        start, end = struct.unpack_from('<QQ', self.data, offset)
+        base = self.layout['string_data']
+        return self.data[base + start:base + end]
+
+    def string(self, idx):
+        value = self._bytes(idx)
+        if value is not None:
+            return value.decode('utf-8')
+
+    def __len__(self):
+        return self.entities['count']
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield SnapshotEntity(self, i)
+
+    def get(self, entity_id):
+        """Find an entity by id, using a binary search over the ids."""
+        if isinstance(entity_id, six.text_type):
+            entity_id = entity_id.encode('utf-8')
+        column = self.entities['columns']['id']
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(self._int(column, mid)) < entity_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self):
+            if self._bytes(self._int(column, lo)) == entity_id:
+                return SnapshotEntity(self, lo)
+
+    def close(self):
+        self.data.close()
+        self.fh.close()
+
+
+class SnapshotEntity(object):
+    """A lazy view of one entity in a ``Snapshot``."""
+    __slots__ = ('snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    def get(self, field):
+        snapshot = self.snapshot
+        offset = snapshot.entities['columns'][field]
+        return snapshot.string(snapshot._int(offset, self.index))
+
+    __getitem__ = get
+
+    @property
+    def id(self):
+        return self.get('id')
+
+    def get_children(self, key):
+        """Get the child records stored under ``key``, e.g. 'aliases'."""
+        snapshot = self.snapshot
+        meta = snapshot.children[key]
+        start = snapshot._int(meta['starts'], self.index)
+        end = snapshot._int(meta['starts'], self.index + 1)
+        records = []
+        for i in range(start, end):
+            record = OrderedDict()
+            for field, offset in meta['columns'].items():
+                record[field] = snapshot.string(snapshot._int(offset, i))
+            records.append(record)
+        return records
+
+    def to_json(self):
+        data = OrderedDict()
+        for field in self.snapshot.entities['fields']:
+            data[field] = self.get(field)
+        for key in self.snapshot.children:
+            data[key] = self.get_children(key)
+        return clean_obj(data)
+
+    def __repr__(self):
+        return '<SnapshotEntity(%r)>' % self.id
@@ -1,39 +1,174 @@
+import os
+import time
 import logging
-from normality import slugify
 from pprint import pprint  # noqa
-from morphium import Archive
 
-from libsanctions.model import Entity, Base, engine, session
-from libsanctions.export import export_csv_tables, export_ijson
-from libsanctions.config import BUCKET
+from libsanctions.model import Entity, Base, get_engine, session
+from libsanctions.model import SaveBatch, Run
+from libsanctions.model import schema_outdated
+from libsanctions.export import export_all
+from libsanctions.screen import build_name_index
+from libsanctions.resolve import resolve_entities
+from libsanctions.tabular import iter_row_chunks, ROW_CHUNK
+from libsanctions.cache import cache, cached_slugify
+from libsanctions.metrics import metrics
+from libsanctions.config import BUCKET, COMMIT_SIZE, COMMIT_INTERVAL
+from libsanctions.config import DATA_PATH
+from libsanctions.config import INCREMENTAL
 
 
 log = logging.getLogger(__name__)
+DELETE_CHUNK = 500
 
 
 class Source(object):
 
-    def __init__(self, name):
+    def __init__(self, name, incremental=INCREMENTAL, resolve=False,
+                 combined=False):
         self.name = name
+        # Cluster the entities of different sources before exporting.
+        self.resolve = resolve
+        # The entities are loaded from other sources and keep their
+        # names, so all of them are exported; otherwise only those of
+        # this source are, whatever else is in the database.
+        self.combined = combined
         self.log = logging.getLogger(name)
+        from morphium import Archive
         prefix = 'v1/sources/%s' % name
         self.archive = Archive(bucket=BUCKET, prefix=prefix)
         self.entity_count = 0
-        Base.metadata.drop_all(engine)
-        Base.metadata.create_all(engine)
+        self.started = time.time()
+        self.export_timings = {}
+        # All entities of this run, by id. Entities from earlier runs are
+        # only ever replaced, so there is nothing to look up in the
+        # database. In an incremental run, they are kept out of the
+        # session until ``reconcile()`` compares them with the stored
+        # ones, so the whole run is held in memory until then.
+        self.entities = {}
+        if incremental and schema_outdated():
+            self.log.warning("Tables are missing columns, reloading all "
+                             "entities instead of updating them.")
+            incremental = False
+        self.incremental = incremental
+        self.changes = {
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'deleted': 0
+        }
+        self.saves = SaveBatch(size=COMMIT_SIZE, interval=COMMIT_INTERVAL)
+        if not incremental:
+            Base.metadata.drop_all(get_engine())
+        Base.metadata.create_all(get_engine())
+        # Content hashes of the entities stored by the previous run.
+        self.hashes = {}
+        if incremental:
+            q = session.query(Entity.id, Entity.content_hash)
+            q = q.filter(Entity.source == name)
+            self.hashes = dict(q)
 
+    @metrics.timed('create_entity')
     def create_entity(self, *keys):
-        keys = [slugify(k, sep='-') for k in keys]
+        keys = [cached_slugify(k, sep='-') for k in keys]
         entity_id = '-'.join([k for k in keys if k is not None])
         entity_id = '%s.%s' % (self.name, entity_id)
-        entity = Entity.by_id(self.name, entity_id)
+        entity = self.entities.get(entity_id)
         if entity is None:
             entity = Entity(self.name, entity_id)
-            session.add(entity)
+            entity.batch = self.saves
+            if not self.incremental:
+                session.add(entity)
+            self.entities[entity_id] = entity
         self.entity_count += 1
         return entity
 
+    def read_rows(self, file_path, chunk_size=ROW_CHUNK, **kwargs):
+        """Stream a CSV, XLS or XLSX file as lists of up to ``chunk_size``
+        row dicts. See ``libsanctions.tabular.iter_rows`` for the other
+        options."""
+        for chunk in iter_row_chunks(file_path, chunk_size=chunk_size,
+                                     **kwargs):
+            metrics.incr('rows_read', len(chunk))
+            yield chunk
+
+    def reconcile(self):
+        """Compare the entities of this run with the previous one, once
+        all of them are complete. New and changed entities are written,
+        the stored rows of changed and vanished ones are deleted, and
+        unchanged ones are left as they are."""
+        entities = list(self.entities.values())
+        for i in range(0, len(entities), COMMIT_SIZE):
+            changed, written = [], []
+            for entity in entities[i:i + COMMIT_SIZE]:
+                entity.content_hash = entity.make_hash()
+                if entity.id not in self.hashes:
+                    self.changes['inserted'] += 1
+                elif self.hashes.pop(entity.id) == entity.content_hash:
+                    self.changes['unchanged'] += 1
+                    continue
+                else:
+                    self.changes['updated'] += 1
+                    changed.append(entity.id)
+                written.append(entity)
+            self.delete_entities(changed)
+            session.add_all(written)
+            session.commit()
+        deleted = list(self.hashes.keys())
+        self.delete_entities(deleted)
+        self.changes['deleted'] = len(deleted)
+        self.hashes = {}
+        session.commit()
+
+    def delete_entities(self, entity_ids):
+        """Delete the stored rows of the given entities."""
+        models = [m for (_, m) in Entity.CHILDREN]
+        for i in range(0, len(entity_ids), DELETE_CHUNK):
+            ids = entity_ids[i:i + DELETE_CHUNK]
+            for model in models:
+                table = model.__table__
+                q = table.delete().where(table.c.entity_id.in_(ids))
+                session.execute(q)
+            table = Entity.__table__
+            session.execute(table.delete().where(table.c.id.in_(ids)))
+
+    def delete_source(self, source_name):
+        """Delete the stored entities which came from ``source_name``.
+        Every table is indexed on its source, so this does not touch the
+        rows of other sources."""
+        for model in [m for (_, m) in Entity.CHILDREN] + [Entity]:
+            table = model.__table__
+            session.execute(table.delete().where(table.c.source ==
+                                                 source_name))
+
     def finish(self):
+        self.saves.flush()
         self.log.info("Parsed %s entities", self.entity_count)
-        export_csv_tables(self.archive)
-        export_ijson(self.archive, self.name)
+        self.log.info("Normalisation cache: %(hits)s hits, %(misses)s "
+                      "misses, %(evictions)s evictions", cache.stats())
+        if self.incremental:
+            self.reconcile()
+            self.log.info("Changes: %(inserted)s inserted, "
+                          "%(updated)s updated, %(unchanged)s unchanged, "
+                          "%(deleted)s deleted", self.changes)
+        build_name_index()
+        if self.resolve:
+            resolve_entities()
+        # Tell any service which caches the data that it has changed.
+        session.add(Run(self.name))
+        session.commit()
+        partition = None if self.combined else self.name
+        self.export_timings = export_all(self.archive, self.name,
+                                         partition=partition)
+        self.write_report()
+
+    def write_report(self):
+        """Write the timers and counters of this run to a JSON file."""
+        file_path = os.path.join(DATA_PATH, '%s.report.json' % self.name)
+        metrics.write_report(file_path,
+                             source=self.name,
+                             duration=time.time() - self.started,
+                             entity_count=self.entity_count,
+                             changes=self.changes,
+                             exports=self.export_timings,
+                             cache=cache.stats())
+        self.log.info("Run report: %s", file_path)
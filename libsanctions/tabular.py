@@ -0,0 +1,126 @@
+import os
+import six
+import logging
+from datetime import datetime
+from normality import slugify
+
+log = logging.getLogger(__name__)
+ROW_CHUNK = 1000
+
+
+def normalize_headers(row):
+    """Turn a header row into unique, slugified keys. Empty or repeated
+    headers are named after their column number."""
+    headers, seen = [], set()
+    for i, value in enumerate(row):
+        header = slugify(value, sep='_')
+        if header is None or header in seen:
+            header = 'column_%s' % i
+        seen.add(header)
+        headers.append(header)
+    return headers
+
+
+def _clean_value(value):
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets store every number as a float, incl. ids.
+        return int(value)
+    if isinstance(value, six.string_types):
+        value = value.strip()
+        if not len(value):
+            return None
+    return value
+
+
+def _iter_csv(file_path, sheet, encoding):
+    from unicodecsv import reader
+    with open(file_path, 'rb') as fh:
+        for row in reader(fh, encoding=encoding or 'utf-8'):
+            yield row
+
+
+def _iter_xls(file_path, sheet, encoding):
+    import xlrd
+    # With on_demand, only the selected sheet is ever parsed.
+    book = xlrd.open_workbook(file_path, on_demand=True,
+                              encoding_override=encoding)
+    try:
+        if sheet is None:
+            sheet = book.sheet_by_index(0)
+        else:
+            sheet = book.sheet_by_name(sheet)
+        for i in range(sheet.nrows):
+            row = []
+            for cell in sheet.row(i):
+                value = cell.value
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    value = datetime(*xlrd.xldate_as_tuple(value,
+                                                           book.datemode))
+                elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK,
+                                    xlrd.XL_CELL_ERROR):
+                    value = None
+                row.append(value)
+            yield row
+    finally:
+        book.release_resources()
+
+
+def _iter_xlsx(file_path, sheet, encoding):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        # xlrd before 2.0 can read .xlsx, but holds all of it in memory.
+        log.warning("openpyxl is not installed, reading %s with xlrd.",
+                    file_path)
+        for row in _iter_xls(file_path, sheet, encoding):
+            yield row
+        return
+    book = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = book.worksheets[0] if sheet is None else book[sheet]
+        for row in sheet.iter_rows(values_only=True):
+            yield row
+    finally:
+        book.close()
+
+
+READERS = {
+    '.csv': _iter_csv,
+    '.xls': _iter_xls,
+    '.xlsx': _iter_xlsx,
+}
+
+
+def iter_rows(file_path, sheet=None, header_row=0, encoding=None):
+    """Stream the rows of a CSV, XLS or XLSX file as dicts, keyed by the
+    normalised headers in row ``header_row``. Rows above the headers and
+    empty rows are skipped. ``sheet`` is a sheet name (the first sheet by
+    default). ``encoding`` applies to CSV files (UTF-8 by default), and
+    overrides the code page of XLS files."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in READERS:
+        raise ValueError("Unknown table format: %s" % file_path)
+    headers = None
+    for i, row in enumerate(READERS[extension](file_path, sheet, encoding)):
+        if i < header_row:
+            continue
+        if headers is None:
+            headers = normalize_headers(row)
+            continue
+        values = [_clean_value(v) for v in row]
+        if not any(v is not None for v in values):
+            continue
+        values.extend([None] * (len(headers) - len(values)))
+        yield dict(zip(headers, values))
+
+
+def iter_row_chunks(file_path, chunk_size=ROW_CHUNK, **kwargs):
+    """Like ``iter_rows``, but yield lists of up to ``chunk_size`` rows."""
+    chunk = []
+    for row in iter_rows(file_path, **kwargs):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk):
+        yield chunk
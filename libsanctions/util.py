@@ -1,3 +1,6 @@
+import sys
+import json
+from types import ModuleType
 from normality import stringify
 from collections import OrderedDict
 from hashlib import sha1
@@ -12,6 +15,37 @@ def remove_namespace(doc, namespace):
             elem.tag = elem.tag[nsl:]
 
 
+def iterparse_records(source, tag, namespace=None):
+    """Stream the ``tag`` elements of an XML document one at a time.
+
+    Namespaces are stripped from the tags of each record as it is parsed,
+    either ``namespace`` only (like ``remove_namespace``) or all of them.
+    Each record is cleared and removed from the tree, with any siblings
+    before it, once the caller moves on, so memory use does not grow with
+    the size of the document. ``source`` is a file name or file object."""
+    from lxml import etree
+    if namespace is None:
+        match = '{*}%s' % tag
+    else:
+        match = '{%s}%s' % (namespace, tag)
+        ns = u'{%s}' % namespace
+        nsl = len(ns)
+    for event, elem in etree.iterparse(source, events=('end',), tag=match):
+        for child in elem.iter(tag=etree.Element):
+            if namespace is None:
+                if child.tag.startswith('{'):
+                    child.tag = child.tag.split('}', 1)[1]
+            elif child.tag.startswith(ns):
+                child.tag = child.tag[nsl:]
+        yield elem
+        elem.clear()
+        parent = elem.getparent()
+        if parent is None:
+            continue
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
 def make_uid(*args):
     uid = sha1()
     for arg in args:
@@ -21,6 +55,13 @@ def make_uid(*args):
     return uid.hexdigest()
 
 
+def entity_hash(data):
+    """Hash the ``to_json()`` of an entity, ignoring the timestamp which
+    changes on every run."""
+    data = dict((k, v) for (k, v) in data.items() if k != 'timestamp')
+    return make_uid(json.dumps(data, sort_keys=True))
+
+
 def clean_obj(data):
     """Remove empty items from JSON output."""
     if isinstance(data, (dict, OrderedDict)):
@@ -38,3 +79,36 @@ def clean_obj(data):
             return None
         return out
     return data
+
+
+class _LazyModule(ModuleType):
+    # Stands in for a module in ``sys.modules``, computing some of its
+    # attributes on access and passing everything else through.
+
+    def __init__(self, module, getters):
+        ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__['_module'] = module
+        self.__dict__['_getters'] = getters
+
+    def __getattr__(self, name):
+        if name in self._getters:
+            return self._getters[name]()
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._module, name)
+
+    def __dir__(self):
+        return sorted(set(dir(self._module)).union(self._getters))
+
+
+def lazy_attributes(module_name, **getters):
+    """Add attributes to a module which are computed by calling their
+    getter each time they are accessed, e.g. to keep a module-level name
+    which would otherwise do expensive work at import time. Call this at
+    the end of the module, with its ``__name__``."""
+    module = sys.modules[module_name]
+    sys.modules[module_name] = _LazyModule(module, getters)
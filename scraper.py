@@ -1,39 +1,204 @@
+import os
 import gc
+import sys
+import six
 import json
 import yaml
-import requests
+import logging
+import threading
+from six.moves import queue
 
-from libsanctions import Source, Entity
-from libsanctions.model import session
+from libsanctions import Source
+from libsanctions.model import Entity, session
+from libsanctions.ingest import RowLoader, insert_rows
+from libsanctions.fetch import FetchCache
+from libsanctions.config import FETCH_CACHE_PATH
+from libsanctions.metrics import metrics
+
+log = logging.getLogger(__name__)
 
 NAME = 'master'
 YAML_URL = 'https://raw.githubusercontent.com/opensanctions/opensanctions.org/master/_data/sources.yml'  # noqa
+YAML_URL = os.environ.get('YAML_URL', YAML_URL)
 SOURCE_URL = 'http://data.opensanctions.org/v1/sources/%s/latest/%s.ijson'
+SOURCE_URL = os.environ.get('SOURCE_URL', SOURCE_URL)
 IGNORE = ['master', 'everypolitician']
 
+# Number of sources downloaded in parallel, and how many batches of
+# decoded entities may wait for the database writer.
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 4))
+QUEUE_SIZE = int(os.environ.get('QUEUE_SIZE', 20))
+BATCH_SIZE = 5000
+
+# Number of processes which decode and normalise the downloaded records
+# for the writer. With 0, the fetcher threads do this themselves.
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', 0))
+
+# Content hashes of the source files ingested by the last combine.
+STATE_PATH = os.path.join(FETCH_CACHE_PATH, 'combine.json')
+
+
+def load_state():
+    if not os.path.exists(STATE_PATH):
+        return {}
+    with open(STATE_PATH, 'r') as fh:
+        return json.load(fh)
+
+
+def save_state(state):
+    with open(STATE_PATH, 'w') as fh:
+        json.dump(state, fh)
 
-def load_source(source_name):
+
+def fetch_source(fetcher, source_name):
     if source_name in IGNORE:
         return
     url = SOURCE_URL % (source_name, source_name)
-    res = requests.get(url, stream=True)
-    if res.status_code != 200:
-        return
-    for line in res.iter_lines():
-        data = json.loads(line)
-        Entity.from_json(data)
+    with metrics.timer('fetch'):
+        return fetcher.fetch(url)
+
+
+def iter_download(download):
+    with open(download.file_path, 'rb') as fh:
+        for line in fh:
+            line = line.strip()
+            if len(line):
+                yield line
+
+
+def fetch_sources(fetcher, loader, names, batches, skip):
+    """Fetcher thread: stream sources from ``names`` onto ``batches``,
+    as chunks of lines handed to ``loader`` for decoding.
+
+    Each download is written to the cache in full before it is read, so
+    its content hash is known before any of its lines are decoded.
+    Sources whose hash is the same as in ``skip`` are not read at all."""
+    while True:
+        try:
+            source_name = names.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            download = fetch_source(fetcher, source_name)
+            if download is None:
+                batches.put(('done', source_name, None))
+                continue
+            if skip.get(source_name) == download.content_hash:
+                batches.put(('skip', source_name, None))
+                continue
+            batch = []
+            for line in iter_download(download):
+                batch.append(line)
+                if len(batch) >= BATCH_SIZE:
+                    metrics.incr('records_read', len(batch))
+                    batches.put(('batch', source_name, loader.submit(batch)))
+                    batch = []
+            if len(batch):
+                metrics.incr('records_read', len(batch))
+                batches.put(('batch', source_name, loader.submit(batch)))
+            batches.put(('done', source_name, download.content_hash))
+        except Exception:
+            log.exception("Failed to load [%s]", source_name)
+            batches.put(('error', source_name, sys.exc_info()))
+
+
+def load_sources(source, source_names, workers=FETCH_WORKERS,
+                 queue_size=QUEUE_SIZE, processes=DECODE_WORKERS):
+    """Download several sources at once, writing them from this thread.
+
+    Batches are written in the order each source was read, however many
+    ``processes`` decode them. In an incremental run, unchanged sources
+    are skipped and changed ones replace the entities they contributed
+    last time, and sources which are no longer listed are deleted. Other
+    runs start from empty tables (see ``Source``), so they load every
+    source, changed or not."""
+    # Fork the decoding processes before the fetcher threads are started,
+    # with no connection checked out by the session.
     session.commit()
+    loader = RowLoader(processes)
+    try:
+        _load_sources(source, source_names, loader, workers, queue_size)
+        loader.close()
+    finally:
+        # Only does anything if the load failed.
+        loader.terminate()
     session.remove()
     gc.collect()
 
 
-def combine():
-    res = requests.get(YAML_URL)
-    source = Source(NAME)
+def _load_sources(source, source_names, loader, workers, queue_size):
+    fetcher = FetchCache(FETCH_CACHE_PATH, pool_size=workers)
+    state = load_state()
+    skip = dict(state) if source.incremental else {}
+    names = queue.Queue()
+    for source_name in source_names:
+        names.put(source_name)
+    batches = queue.Queue(maxsize=queue_size)
+    for i in range(min(workers, len(source_names))):
+        thread = threading.Thread(target=fetch_sources,
+                                  args=(fetcher, loader, names, batches,
+                                        skip))
+        thread.daemon = True
+        thread.start()
+
+    cleared = set()
+    pending = len(source_names)
+    while pending > 0:
+        kind, source_name, payload = batches.get()
+        if kind == 'error':
+            # Raise with the traceback from the fetcher thread.
+            six.reraise(*payload)
+        changed = kind == 'batch' or (kind == 'done' and payload is not None)
+        if changed and source.incremental and source_name not in cleared:
+            source.delete_source(source_name)
+            cleared.add(source_name)
+        if kind == 'batch':
+            insert_rows(payload.get())
+            continue
+        if kind == 'skip':
+            log.info("Unchanged [%s]", source_name)
+        elif payload is None:
+            log.info("Not available [%s]", source_name)
+            # An incremental run keeps whatever was loaded before.
+            if not source.incremental:
+                state.pop(source_name, None)
+        else:
+            log.info("Loaded [%s]", source_name)
+            state[source_name] = payload
+        session.commit()
+        pending -= 1
+    if source.incremental:
+        delete_removed(source, source_names, state)
+    session.commit()
+    save_state(state)
+
+
+def delete_removed(source, source_names, state):
+    """Delete the entities of the sources which are no longer listed,
+    and forget their content hashes."""
+    stored = set(name for (name,) in session.query(Entity.source).distinct())
+    for source_name in sorted(stored.union(state.keys())):
+        if source_name in source_names:
+            continue
+        log.info("Removed [%s]", source_name)
+        source.delete_source(source_name)
+        state.pop(source_name, None)
+
+
+def load_source(source, source_name):
+    load_sources(source, [source_name], workers=1)
+
+
+def combine(workers=FETCH_WORKERS, processes=DECODE_WORKERS):
+    fetcher = FetchCache(FETCH_CACHE_PATH)
+    res = fetcher.session.get(YAML_URL)
+    source = Source(NAME, resolve=True, combined=True)
+    source_names = []
     for data in yaml.load(res.content):
-        source_name = data.get('slug')
         source.log.info("Combine [%(slug)s]: %(title)s", data)
-        load_source(source_name)
+        source_names.append(data.get('slug'))
+    load_sources(source, source_names, workers=workers,
+                 processes=processes)
     source.finish()
 
 
@@ -16,7 +16,8 @@ setup(
     author_email='friedrich@pudo.org',
     url='http://opensanctions.org',
     license='MIT',
-    packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
+    packages=find_packages(exclude=['ez_setup', 'examples', 'tests',
+                                    'benchmarks']),
     namespace_packages=[],
     include_package_data=True,
     zip_safe=False,
@@ -35,6 +36,10 @@ setup(
         'xlrd',
         'six'
     ],
+    extras_require={
+        'match': ['numpy'],
+        'xlsx': ['openpyxl'],
+    },
     entry_points={},
-    tests_require=[]
+    tests_require=['nose']
 )
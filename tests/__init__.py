@@ -0,0 +1,22 @@
+"""Tests for libsanctions, run against a temporary SQLite database.
+
+    python -m pytest tests
+
+The database and the exports go to a temporary directory, which is
+removed on exit. This has to be set up before ``libsanctions`` is
+imported.
+"""
+import os
+import atexit
+import shutil
+import tempfile
+
+TEST_PATH = tempfile.mkdtemp(prefix='libsanctions-test-')
+atexit.register(shutil.rmtree, TEST_PATH, True)
+os.environ['DATA_PATH'] = TEST_PATH
+
+from django.conf import settings  # noqa
+
+if not settings.configured:
+    database = os.path.join(TEST_PATH, 'test.sqlite')
+    settings.configure(OFAC_DATABASE_URI='sqlite:///%s' % database)
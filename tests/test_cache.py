@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from libsanctions.cache import LRUCache, TTLCache
+
+
+class LRUCacheTestCase(TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        # 'b' is the least recently used now.
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b', 'missing'), 'missing')
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_memoize(self):
+        cache = LRUCache(10)
+        calls = []
+
+        @cache.memoize
+        def nothing(value):
+            calls.append(value)
+            return None
+
+        self.assertIsNone(nothing('a'))
+        self.assertIsNone(nothing('a'))
+        self.assertEqual(calls, ['a'])
+        # Lists can't be cached, but are still passed on.
+        self.assertIsNone(nothing(['b']))
+        self.assertIsNone(nothing(['b']))
+        self.assertEqual(calls, ['a', ['b'], ['b']])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_unhashable(self):
+        cache = LRUCache(10)
+        self.assertRaises(TypeError, cache.get, ['a'])
+
+
+class TTLCacheTestCase(TestCase):
+
+    def test_expiry(self):
+        cache = TTLCache(10, 60)
+        self.assertIsInstance(cache, LRUCache)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        cache = TTLCache(10, -1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_eviction(self):
+        cache = TTLCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
@@ -0,0 +1,98 @@
+import os
+import json
+from unittest import TestCase, skipUnless
+
+import six
+
+from benchmarks.generate import generate_entities
+from libsanctions.delta import DeltaWriter, apply_delta, make_version
+from libsanctions.delta import load_state, commit_state, discard_state
+from libsanctions.export import export_all, write_ijson, _state_path
+from libsanctions.model import Entity, session
+from libsanctions.util import entity_hash
+from tests.util import load_records, StubArchive, FailingArchive
+
+
+def _read(file_path):
+    with open(file_path, 'r') as fh:
+        return fh.readlines()
+
+
+def _export():
+    # The exported entities by id, and the lines of the delta.
+    paths = write_ijson('test', delta=True)
+    entities = {}
+    for line in _read(paths[0]):
+        data = json.loads(line)
+        entities[data['id']] = data
+    return entities, _read(paths[2])
+
+
+class DeltaTestCase(TestCase):
+
+    def setUp(self):
+        self.state_path = _state_path('test')
+        for path in (self.state_path, self.state_path + '.tmp'):
+            if os.path.exists(path):
+                os.unlink(path)
+        load_records(list(generate_entities(50, source='test')))
+
+    def test_first_export_adds_all(self):
+        entities, lines = _export()
+        end = json.loads(lines[-1])
+        self.assertIsNone(json.loads(lines[0])['previous'])
+        self.assertEqual(end['added'], 50)
+        versions = [entity_hash(e) for e in entities.values()]
+        self.assertEqual(end['version'], make_version(versions))
+
+    def test_state_only_replaced_on_commit(self):
+        _export()
+        self.assertIsNone(load_state(self.state_path))
+        commit_state(self.state_path)
+        self.assertEqual(len(load_state(self.state_path)), 50)
+
+        session.query(Entity).filter(Entity.id == 'test.1').delete()
+        session.commit()
+        _export()
+        discard_state(self.state_path)
+        # An export which was not published does not become the base.
+        self.assertEqual(len(load_state(self.state_path)), 50)
+        self.assertFalse(os.path.exists(self.state_path + '.tmp'))
+
+    def test_apply_delta(self):
+        previous, _ = _export()
+        commit_state(self.state_path)
+        version = make_version(load_state(self.state_path).values())
+
+        entity = session.query(Entity).filter(Entity.id == 'test.2').one()
+        entity.program = 'Changed'
+        session.query(Entity).filter(Entity.id == 'test.3').delete()
+        session.add(Entity('test', 'test.new'))
+        session.commit()
+        current, lines = _export()
+        end = json.loads(lines[-1])
+        self.assertEqual((end['added'], end['modified'], end['removed']),
+                         (1, 1, 1))
+        version = apply_delta(previous, lines, version)
+        self.assertEqual(previous, current)
+        self.assertEqual(version, end['version'])
+        with self.assertRaises(ValueError):
+            apply_delta({}, lines, 'f' * 40)
+
+    @skipUnless(six.PY2, "unicodecsv writes to text files on Python 2 only")
+    def test_delta_state_after_upload(self):
+        with self.assertRaises(IOError):
+            export_all(FailingArchive(), 'test', delta=True, snapshot=False)
+        self.assertFalse(os.path.exists(self.state_path))
+        self.assertFalse(os.path.exists(self.state_path + '.tmp'))
+        export_all(StubArchive(), 'test', delta=True, snapshot=False)
+        self.assertTrue(os.path.exists(self.state_path))
+
+    def test_abort(self):
+        fh = open(os.path.join(os.path.dirname(self.state_path),
+                               'aborted.delta.ijson'), 'w')
+        writer = DeltaWriter(fh, self.state_path)
+        writer.add({'id': 'test.1'})
+        writer.abort()
+        self.assertTrue(fh.closed)
+        self.assertFalse(os.path.exists(self.state_path + '.tmp'))
@@ -0,0 +1,185 @@
+import os
+import json
+from unittest import TestCase, skipUnless
+
+import six
+from sqlalchemy import event
+from unicodecsv import DictWriter
+
+from benchmarks.generate import generate_entities
+from libsanctions.export import CSV_EXPORTS, write_csv_table
+from libsanctions.export import export_all, write_single_pass
+from libsanctions.export import write_ijson, write_snapshot
+from libsanctions.export import iter_entity_chunks, EXPORT_CHUNK
+from libsanctions.snapshot import Snapshot
+from libsanctions.model import Entity, session, get_engine
+from tests import TEST_PATH
+from tests.util import load_records, stored_entities, StubArchive
+
+
+@skipUnless(six.PY2, "unicodecsv writes to text files on Python 2 only")
+class CsvExportTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_records(list(generate_entities(100)))
+
+    def test_same_file_as_to_row(self):
+        for model, name in CSV_EXPORTS:
+            file_path = write_csv_table(model, name)
+            expected = os.path.join(TEST_PATH, 'expected.csv')
+            with open(expected, 'w') as fh:
+                writer = None
+                for obj in session.query(model):
+                    row = obj.to_row()
+                    if writer is None:
+                        writer = DictWriter(fh, row.keys())
+                        writer.writeheader()
+                    writer.writerow(row)
+            with open(file_path, 'rb') as fh:
+                data = fh.read()
+            with open(expected, 'rb') as fh:
+                self.assertEqual(data, fh.read(), name)
+
+
+@skipUnless(six.PY2, "unicodecsv writes to text files on Python 2 only")
+class ExportAllTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_records(list(generate_entities(50)))
+
+    def test_timings(self):
+        archive = StubArchive()
+        timings = export_all(archive, 'test', workers=3, delta=False)
+        names = [name for (_, name) in CSV_EXPORTS] + ['ijson', 'snapshot']
+        for name in names:
+            self.assertIn(name, timings)
+        for file_name in archive.uploaded:
+            self.assertIn('upload:%s' % file_name, timings)
+        self.assertEqual(len(timings), len(names) + len(archive.uploaded))
+        self.assertIn('test.snapshot', archive.uploaded)
+
+    def test_single_pass_without_snapshot(self):
+        archive = StubArchive()
+        timings = export_all(archive, 'test', single_pass=True,
+                             delta=False, snapshot=False)
+        self.assertIn('tables', timings)
+        self.assertNotIn('snapshot', timings)
+        self.assertIn('entities.csv', archive.uploaded)
+        self.assertIn('test.ijson', archive.uploaded)
+
+    def test_compression_by_export(self):
+        archive = StubArchive()
+        timings = export_all(archive, 'test', delta=False,
+                             compression='gzip,snapshot=none')
+        # Only the uncompressed snapshot is uploaded after it is written.
+        self.assertEqual(archive.uploaded, ['test.snapshot'])
+        self.assertNotIn('upload:test.ijson', timings)
+        export_path = os.path.join(TEST_PATH, 'exports')
+        self.assertTrue(os.path.exists(os.path.join(export_path,
+                                                    'test.ijson.gz')))
+        with self.assertRaises(ValueError):
+            export_all(archive, 'test', compression={'ijson': 'zip'})
+
+
+class RecordingFile(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.state = None
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        self.state = 'closed'
+
+    def abort(self):
+        self.state = 'aborted'
+
+
+class SinglePassTestCase(TestCase):
+
+    def test_abort_on_error(self):
+        opened = []
+
+        def open_file(file_name, mode='w'):
+            if file_name == 'test.ijson':
+                raise IOError('disk full')
+            opened.append(RecordingFile(file_name))
+            return opened[-1]
+
+        with self.assertRaises(IOError):
+            write_single_pass('test', open_file=open_file, delta=True)
+        names = [f.name for f in opened]
+        self.assertIn('entities.csv', names)
+        self.assertIn('test.ijson.idx', names)
+        self.assertIn('test.delta.ijson', names)
+        for handle in opened:
+            self.assertEqual(handle.state, 'aborted', handle.name)
+
+
+class PartitionTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        records = list(generate_entities(30, source='alpha'))
+        records.extend(generate_entities(20, source='beta'))
+        load_records(records)
+
+    def test_ijson(self):
+        paths = write_ijson('alpha', partition='alpha')
+        with open(paths[0], 'rb') as fh:
+            ids = [json.loads(line.decode('utf-8'))['id'] for line in fh]
+        self.assertEqual(len(ids), 30)
+        self.assertTrue(all(i.startswith('alpha.') for i in ids))
+
+    def test_snapshot(self):
+        snapshot = Snapshot(write_snapshot('beta', partition='beta'))
+        try:
+            self.assertEqual(len(snapshot), 20)
+            for entity in snapshot:
+                self.assertEqual(entity['source'], 'beta')
+                stored = session.query(Entity).get(entity.id)
+                self.assertEqual(len(entity.get_children('aliases')),
+                                 len(stored.aliases))
+        finally:
+            snapshot.close()
+
+
+class EntityChunksTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_records(list(generate_entities(EXPORT_CHUNK + 100)))
+        cls.expected = stored_entities()
+        session.remove()
+
+    def test_chunks(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(get_engine(), 'before_cursor_execute', count)
+        try:
+            chunks, children = [], 0
+            for entities in iter_entity_chunks():
+                chunks.append([e.id for e in entities])
+                for entity in entities:
+                    data = entity.to_json()
+                    data.pop('timestamp')
+                    self.assertEqual(data, self.expected[entity.id])
+                    children += sum(len(getattr(entity, key))
+                                    for (key, _) in Entity.CHILDREN)
+        finally:
+            event.remove(get_engine(), 'before_cursor_execute', count)
+        self.assertEqual([len(c) for c in chunks], [EXPORT_CHUNK, 100])
+        ids = [i for chunk in chunks for i in chunk]
+        self.assertEqual(ids, sorted(self.expected))
+        self.assertGreater(children, len(ids))
+        # One query for each page of entities and one per child table,
+        # then one which finds no more entities; nothing is lazy-loaded.
+        queries = len(chunks) * (1 + len(Entity.CHILDREN)) + 1
+        self.assertEqual(len(statements), queries)
+        self.assertEqual(len(session.identity_map), 0)
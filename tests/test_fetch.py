@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from libsanctions.fetch import FetchCache
+from tests import TEST_PATH
+from tests.util import serve_fixtures, FIXTURES_PATH
+
+
+class FetchCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(dir=TEST_PATH)
+        self.root = os.path.join(self.path, 'root')
+        shutil.copytree(FIXTURES_PATH, self.root)
+        self.cache = FetchCache(os.path.join(self.path, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_conditional_get(self):
+        with serve_fixtures(self.root) as base_url:
+            url = base_url + '/sources/alpha/alpha.ijson'
+            first = self.cache.fetch(url)
+            second = self.cache.fetch(url)
+            with open(os.path.join(self.root, 'sources', 'alpha',
+                                   'alpha.ijson'), 'ab') as fh:
+                fh.write(b'{"id": "alpha.4", "name": "Delta"}\n')
+            third = self.cache.fetch(url)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(first.file_path, second.file_path)
+        self.assertFalse(third.cached)
+        self.assertNotEqual(third.content_hash, first.content_hash)
+        with open(third.file_path, 'rb') as fh:
+            self.assertTrue(fh.read().endswith(b'"Delta"}\n'))
+
+    def test_missing(self):
+        with serve_fixtures(self.root) as base_url:
+            download = self.cache.fetch(base_url + '/sources/nothing.ijson')
+        self.assertIsNone(download)
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from benchmarks.imports import measure_import, BUDGET
+from libsanctions import config, model
+
+# The dependencies the models need in any case. Their import time
+# depends on the machine more than on this package.
+REQUIRED = ('sqlalchemy.orm', 'sqlalchemy.ext.declarative',
+            'sqlalchemy.ext.hybrid', 'normality')
+
+
+class ImportTestCase(TestCase):
+
+    def test_no_heavy_imports(self):
+        seconds, heavy = measure_import(repeat=1)
+        self.assertEqual(heavy, [])
+
+    def test_import_budget(self):
+        seconds, heavy = measure_import(repeat=3, preload=REQUIRED)
+        self.assertLess(seconds, BUDGET / 2)
+
+    def test_lazy_aliases(self):
+        self.assertEqual(config.DATABASE_URI, config.database_uri())
+        self.assertIs(model.engine, model.get_engine())
+        from libsanctions.model import engine
+        self.assertIs(engine, model.get_engine())
+
+    def test_module_attributes_pass_through(self):
+        workers = config.EXPORT_WORKERS
+        config.EXPORT_WORKERS = workers + 1
+        try:
+            self.assertEqual(config.EXPORT_WORKERS, workers + 1)
+        finally:
+            config.EXPORT_WORKERS = workers
+        self.assertIn('engine', dir(model))
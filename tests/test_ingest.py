@@ -0,0 +1,77 @@
+import json
+import multiprocessing
+from unittest import TestCase
+
+from benchmarks.generate import generate_entities
+from libsanctions.ingest import RowLoader, prepare_rows, insert_rows
+from libsanctions.model import Entity, session, get_engine
+from tests.util import reset_database, stored_entities
+
+
+def _lines(records):
+    return [json.dumps(data).encode('utf-8') for data in records]
+
+
+class IngestTestCase(TestCase):
+
+    def setUp(self):
+        self.records = list(generate_entities(200))
+
+    def test_same_rows_as_bulk_from_json(self):
+        reset_database()
+        Entity.bulk_from_json(self.records)
+        session.commit()
+        expected = stored_entities()
+
+        reset_database()
+        count = insert_rows(prepare_rows(_lines(self.records)))
+        session.commit()
+        self.assertEqual(count, len(self.records))
+        self.assertEqual(stored_entities(), expected)
+
+    def test_loader_keeps_order(self):
+        lines = _lines(self.records)
+        loader = RowLoader(2)
+        try:
+            results = [loader.submit(lines[i:i + 50])
+                       for i in range(0, len(lines), 50)]
+            prepared = [result.get() for result in results]
+            loader.close()
+        finally:
+            loader.terminate()
+        expected = [prepare_rows(lines[i:i + 50])
+                    for i in range(0, len(lines), 50)]
+        # Only the timestamps differ.
+        for got, want in zip(prepared, expected):
+            self.assertEqual([(i, len(r)) for (i, r) in got],
+                             [(i, len(r)) for (i, r) in want])
+            self.assertEqual(got[1:], want[1:])
+
+
+class RowLoaderTestCase(TestCase):
+
+    def test_forks_without_pooled_connections(self):
+        reset_database()
+        session.query(Entity).count()
+        session.commit()
+        pool = get_engine().pool
+        loader = RowLoader(1)
+        try:
+            self.assertIsNot(get_engine().pool, pool)
+        finally:
+            loader.terminate()
+
+    def test_terminate_joins_workers(self):
+        loader = RowLoader(2)
+        loader.submit([b'{"id": "test.1", "source": "test"}']).get()
+        loader.terminate()
+        self.assertIsNone(loader.pool)
+        self.assertEqual(multiprocessing.active_children(), [])
+        # Closing after a terminate does nothing.
+        loader.close()
+
+    def test_without_processes(self):
+        loader = RowLoader(0)
+        prepared = loader.submit([b'{"id": "test.1", "source": "test"}'])
+        self.assertEqual(len(prepared.get()), 1)
+        loader.close()
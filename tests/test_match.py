@@ -0,0 +1,56 @@
+from unittest import TestCase, skipIf
+
+try:
+    from libsanctions.match import Matcher, make_ngrams
+except ImportError:
+    Matcher = None
+
+NAMES = [
+    ('a', 'Ivan Petrov'),
+    ('a', 'Ivan Petroff'),
+    ('b', 'Maritime Trading LLC'),
+    ('c', 'Omar Haddad'),
+    ('d', 'Ocean Star'),
+    ('e', 'Ivana Petrova'),
+]
+
+
+@skipIf(Matcher is None, "numpy is not installed")
+class MatcherTestCase(TestCase):
+
+    def test_ngrams(self):
+        self.assertEqual(make_ngrams('Ab'), set([' ab', 'ab ']))
+        self.assertEqual(make_ngrams(None), set())
+
+    def test_match(self):
+        matcher = Matcher(NAMES)
+        results = matcher.match('Ivan Petrof', threshold=0.3)
+        self.assertEqual(results[0][0], 'a')
+        self.assertIn('e', [e for (e, _) in results])
+        self.assertEqual(len(set(e for (e, _) in results)), len(results))
+        self.assertEqual(matcher.match('Xyzzy'), [])
+
+    def test_split_batches_match_the_same(self):
+        matcher = Matcher(NAMES)
+        queries = ['Ivan Petrof', 'Omar Hadad', 'Ocean Starr', 'Maritim']
+        expected = matcher.match_many(queries, threshold=0.2)
+        # Every query expands more than one pair, so each is scored on
+        # its own.
+        split = matcher.match_many(queries, threshold=0.2, max_pairs=1)
+        self.assertEqual(split, expected)
+
+    def test_max_df(self):
+        matcher = Matcher(NAMES, max_df=1)
+        # All n-grams of 'Ivan' occur in more than one name.
+        self.assertEqual(matcher.match('Ivan', threshold=0.1), [])
+
+    def test_common_ngrams_still_score(self):
+        names = [('n%s' % i, 'Mohammed Ali N%s' % i) for i in range(50)]
+        names.append(('x', 'Mohammed Ali Hassan'))
+        matcher = Matcher(names, max_df=20)
+        results = matcher.match('Mohammed Ali Hassan')
+        # Only the rare n-grams of 'Hassan' make it a candidate, but it
+        # is scored on all of them.
+        self.assertEqual(results, [('x', 1.0)])
+        split = matcher.match_many(['Mohammed Ali Hassan'], max_pairs=1)
+        self.assertEqual(split, [results])
@@ -0,0 +1,80 @@
+import json
+from unittest import TestCase
+
+from benchmarks.generate import generate_entities
+from libsanctions.model import Entity, Alias, Address, session
+from libsanctions.util import clean_obj
+from tests.util import load_records, reset_database, stored_entities
+
+
+class BulkFromJsonTestCase(TestCase):
+
+    def setUp(self):
+        self.records = list(generate_entities(200))
+
+    def test_same_rows_as_from_json(self):
+        reset_database()
+        for data in self.records:
+            Entity.from_json(data)
+        session.commit()
+        expected = stored_entities()
+
+        reset_database()
+        count = Entity.bulk_from_json(self.records, batch_size=64)
+        session.commit()
+        self.assertEqual(count, len(self.records))
+        self.assertEqual(stored_entities(), expected)
+
+    def test_normalises_values(self):
+        reset_database()
+        Entity.bulk_from_json([{
+            'id': 'test.1',
+            'source': 'test',
+            'name': '  Ivan   Petrov ',
+            'aliases': [{'name': 'Ivan  P.'}]
+        }])
+        session.commit()
+        entity = session.query(Entity).one()
+        self.assertEqual(entity.name, 'Ivan Petrov')
+        self.assertEqual(entity.aliases[0].name, 'Ivan P.')
+        self.assertEqual(entity.aliases[0].source, 'test')
+
+
+class ChildSourceTestCase(TestCase):
+
+    def setUp(self):
+        reset_database()
+        self.entity = Entity('test', 'test.1')
+        session.add(self.entity)
+        session.commit()
+
+    def test_from_entity(self):
+        alias = Alias(None, name='Ivan')
+        alias.entity = Entity('other', 'other.1')
+        session.add(alias)
+        session.commit()
+        self.assertEqual(alias.source, 'other')
+
+    def test_from_entity_id(self):
+        address = Address('test.1')
+        session.add(address)
+        session.commit()
+        self.assertEqual(address.source, 'test')
+
+    def test_kept_if_set(self):
+        alias = self.entity.create_alias(name='Ivan')
+        session.commit()
+        self.assertEqual(alias.source, 'test')
+
+
+class ToJsonTestCase(TestCase):
+
+    def test_same_as_clean_obj(self):
+        load_records(list(generate_entities(400)))
+        for entity in session.query(Entity):
+            # How to_json() used to build it: the full rows, cleaned.
+            data = entity.to_row()
+            for key, _ in Entity.CHILDREN:
+                data[key] = [c.to_json() for c in getattr(entity, key)]
+            self.assertEqual(json.dumps(entity.to_json()),
+                             json.dumps(clean_obj(data)))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import json
+from unittest import TestCase
+
+from benchmarks.generate import generate_entities
+from libsanctions.export import write_ijson
+from libsanctions.offsets import IndexWriter, IjsonReader, INDEX_SUFFIX
+from tests import TEST_PATH
+from tests.util import load_records
+
+
+class IjsonReaderTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        load_records(list(generate_entities(200)))
+        cls.paths = write_ijson('offsets')
+        cls.expected = {}
+        with io.open(cls.paths[0], 'r', encoding='utf-8') as fh:
+            for line in fh:
+                data = json.loads(line)
+                cls.expected[data['id']] = data
+        cls.reader = IjsonReader(cls.paths[0])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.reader.close()
+
+    def test_lookup(self):
+        self.assertEqual(len(self.reader), len(self.expected))
+        for entity_id, data in self.expected.items():
+            self.assertIn(entity_id, self.reader)
+            self.assertEqual(self.reader.get(entity_id), data)
+        self.assertIsNone(self.reader.get('bench.missing'))
+        self.assertNotIn(u'bench.\xe9', self.reader)
+
+    def test_ids_sorted(self):
+        ids = list(self.reader.ids())
+        self.assertEqual(ids, sorted(self.expected,
+                                     key=lambda i: i.encode('utf-8')))
+
+    def test_shards(self):
+        shards = self.reader.shards(4096)
+        self.assertGreater(len(shards), 1)
+        self.assertEqual(shards[0][0], 0)
+        for (_, end), (start, _) in zip(shards, shards[1:]):
+            self.assertEqual(end, start)
+        entities = [e for s in shards for e in self.reader.iter_shard(*s)]
+        self.assertEqual(len(entities), len(self.expected))
+        for data in entities:
+            self.assertEqual(data, self.expected[data['id']])
+
+
+class IndexWriterTestCase(TestCase):
+
+    def setUp(self):
+        self.file_path = os.path.join(TEST_PATH, 'unordered.ijson')
+
+    def tearDown(self):
+        for path in (self.file_path, self.file_path + INDEX_SUFFIX):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def write(self, ids):
+        index = IndexWriter(open(self.file_path + INDEX_SUFFIX, 'wb'))
+        with open(self.file_path, 'wb') as fh:
+            for entity_id in ids:
+                line = json.dumps({'id': entity_id}).encode('utf-8')
+                fh.write(line + b'\n')
+                index.add(entity_id, len(line))
+        index.close()
+        return index
+
+    def test_ordered_ids(self):
+        ids = [u'A', u'a', u'b', u'\xe9']
+        self.assertTrue(self.write(ids).ordered)
+        with IjsonReader(self.file_path) as reader:
+            self.assertEqual(list(reader.ids()), ids)
+            for entity_id in ids:
+                self.assertEqual(reader.get(entity_id), {'id': entity_id})
+
+    def test_unordered_ids(self):
+        # Ids in an order a database collation might give them, which
+        # is not the order of their bytes.
+        ids = [u'b', u'\xe9', u'A', u'a']
+        self.assertFalse(self.write(ids).ordered)
+        with IjsonReader(self.file_path) as reader:
+            self.assertEqual(list(reader.ids()), [u'A', u'a', u'b', u'\xe9'])
+            for entity_id in ids:
+                self.assertEqual(reader.get(entity_id), {'id': entity_id})
+
+    def test_empty_index(self):
+        open(self.file_path, 'wb').close()
+        open(self.file_path + INDEX_SUFFIX, 'wb').close()
+        with self.assertRaises(ValueError):
+            IjsonReader(self.file_path)
@@ -0,0 +1,74 @@
+import re
+from unittest import TestCase, SkipTest
+
+from benchmarks.generate import generate_entities
+from libsanctions.model import Entity, session, get_engine
+from tests.util import load_records
+
+SOURCE = 'bench'
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+
+
+def explain(statement):
+    engine = get_engine()
+    compiled = statement.compile(dialect=engine.dialect)
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    rows = engine.execute('EXPLAIN QUERY PLAN %s' % compiled, params)
+    return [row[-1] for row in rows]
+
+
+class QueryPlanTestCase(TestCase):
+    """Lookups, deletes and exports have to use the indexes."""
+
+    @classmethod
+    def setUpClass(cls):
+        if get_engine().dialect.name != 'sqlite':
+            raise SkipTest("Query plans are checked on SQLite only.")
+        load_records(generate_entities(200, source=SOURCE))
+
+    def assertUsesIndex(self, statement, index, ordered=False):
+        plan = explain(statement)
+        for step in plan:
+            self.assertIsNone(FULL_SCAN.match(step), plan)
+        self.assertTrue(any('USING INDEX %s ' % index in step or
+                            'USING COVERING INDEX %s ' % index in step
+                            for step in plan), plan)
+        if ordered:
+            # Pages through a whole source must come in index order.
+            self.assertFalse(any('TEMP B-TREE' in step for step in plan),
+                             plan)
+
+    def test_entity_by_id(self):
+        q = session.query(Entity).filter(Entity.id == 'bench.1')
+        q = q.filter(Entity.source == SOURCE)
+        plan = explain(q.statement)
+        self.assertEqual(len(plan), 1)
+        self.assertIn('(id=?)', plan[0])
+
+    def test_partition_page(self):
+        q = session.query(Entity).filter(Entity.source == SOURCE)
+        q = q.filter(Entity.id > 'bench.1').order_by(Entity.id).limit(500)
+        self.assertUsesIndex(q.statement, 'ix_data_source_id', ordered=True)
+
+    def test_delete_entities_of_source(self):
+        table = Entity.__table__
+        q = table.delete().where(table.c.source == SOURCE)
+        self.assertUsesIndex(q, 'ix_data_source_id')
+
+    def test_children_by_entity(self):
+        for key, model in Entity.CHILDREN:
+            table = model.__table__
+            index = 'ix_%s_entity_id' % table.name
+            q = session.query(model).filter(model.entity_id.in_(['a', 'b']))
+            self.assertUsesIndex(q.order_by(model.id).statement, index)
+            q = table.delete().where(table.c.entity_id.in_(['a', 'b']))
+            self.assertUsesIndex(q, index)
+
+    def test_children_by_source(self):
+        for key, model in Entity.CHILDREN:
+            table = model.__table__
+            index = 'ix_%s_source' % table.name
+            q = table.select().where(table.c.source == SOURCE)
+            self.assertUsesIndex(q, index)
+            q = table.delete().where(table.c.source == SOURCE)
+            self.assertUsesIndex(q, index)
@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+from libsanctions.model import Entity, session
+from libsanctions.resolve import UnionFind, Resolver, resolve_entities
+from libsanctions.screen import build_name_index
+from tests.util import load_records
+
+
+def _entity(entity_id, name, type_='individual', numbers=(), dates=()):
+    return {
+        'id': entity_id,
+        'source': entity_id.split('.')[0],
+        'name': name,
+        'type': type_,
+        'identifiers': [{'number': n, 'country': 'Russia'} for n in numbers],
+        'birth_dates': [{'date': d} for d in dates]
+    }
+
+
+def _clusters(records):
+    load_records(records)
+    build_name_index()
+    return sorted(sorted(c) for c in Resolver().run())
+
+
+class UnionFindTestCase(TestCase):
+
+    def test_union(self):
+        sets = UnionFind(4)
+        self.assertTrue(sets.union(0, 1))
+        self.assertTrue(sets.union(2, 1))
+        self.assertFalse(sets.union(0, 2))
+        self.assertEqual(sets.find(2), 0)
+        self.assertEqual(sets.find(3), 3)
+
+    def test_labels(self):
+        sets = UnionFind(4, labels=['a', 'b', 'a', 'c'])
+        self.assertFalse(sets.union(0, 2))
+        self.assertTrue(sets.union(0, 1))
+        # 2 would join 'a' to a set which has one already.
+        self.assertFalse(sets.union(1, 2))
+        self.assertTrue(sets.union(3, 1))
+        self.assertEqual(sets.find(3), 0)
+
+
+class ResolverTestCase(TestCase):
+
+    def test_identifier_separators(self):
+        clusters = _clusters([
+            _entity('a.1', 'Ivan Petrov', numbers=['ab-123 456']),
+            _entity('b.1', 'I. Petrov', numbers=['AB123456']),
+            _entity('c.1', 'Petrov', numbers=['AB 123.456']),
+            _entity('d.1', 'Oleg Sidorov', numbers=['AB123457']),
+        ])
+        self.assertEqual(clusters, [['a.1', 'b.1', 'c.1']])
+
+    def test_types_differ(self):
+        clusters = _clusters([
+            _entity('a.1', 'Ocean Star', numbers=['123']),
+            _entity('b.1', 'Ocean Star', type_='vessel', numbers=['123']),
+        ])
+        self.assertEqual(clusters, [])
+
+    def test_names_need_birth_dates_for_individuals(self):
+        clusters = _clusters([
+            _entity('a.1', 'Ivan Petrov'),
+            _entity('b.1', 'Ivan Petrov'),
+            _entity('a.2', 'Anna Ivanova', dates=['1960-01-01']),
+            _entity('b.2', 'Anna Ivanova', dates=['1960-01-01']),
+            _entity('a.3', 'Ocean Trading', type_='company'),
+            _entity('b.3', 'Ocean Trading', type_='company'),
+            _entity('a.4', 'Untyped Name', type_=None),
+            _entity('b.4', 'Untyped Name', type_=None),
+        ])
+        self.assertEqual(clusters, [['a.2', 'b.2'], ['a.3', 'b.3'],
+                                    ['a.4', 'b.4']])
+
+    def test_no_two_members_of_a_source(self):
+        # b.1 matches both a.1 and a.2, which are different entities of
+        # the same source; only one of them can join its cluster.
+        clusters = _clusters([
+            _entity('a.1', 'Ivan Petrov', numbers=['111']),
+            _entity('b.1', 'Ivan Petrov', numbers=['111', '222']),
+            _entity('a.2', 'Ivan Petrov', numbers=['222']),
+        ])
+        self.assertEqual(len(clusters), 1)
+        sources = [i.split('.')[0] for i in clusters[0]]
+        self.assertEqual(sorted(sources), ['a', 'b'])
+
+    def test_canonical_id(self):
+        load_records([
+            _entity('b.1', 'Ivan Petrov', numbers=['111']),
+            _entity('a.1', 'Ivan Petrov', numbers=['111']),
+            _entity('c.1', 'Oleg Sidorov', numbers=['222']),
+        ])
+        build_name_index()
+        resolve_entities()
+        canonical = dict(session.query(Entity.id, Entity.canonical_id))
+        self.assertEqual(canonical, {'a.1': 'a.1', 'b.1': 'a.1',
+                                     'c.1': None})
+        entity = Entity.by_id('b', 'b.1')
+        self.assertEqual(list(entity.to_row().keys())[-1], 'canonical_id')
+        self.assertEqual(entity.to_json()['canonical_id'], 'a.1')
@@ -0,0 +1,129 @@
+import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
+import traceback
+from unittest import TestCase
+
+import scraper
+from libsanctions.metrics import metrics
+from libsanctions.model import Entity, session
+from tests import TEST_PATH
+from tests.util import reset_database, serve_fixtures, FIXTURES_PATH
+
+
+class StubSource(object):
+    # Stands in for the master ``Source``, which would export on finish.
+    incremental = False
+
+    def __init__(self, incremental=False):
+        self.incremental = incremental
+        self.deleted = []
+
+    def delete_source(self, source_name):
+        self.deleted.append(source_name)
+        session.query(Entity).filter(Entity.source == source_name).delete()
+
+
+class LoadSourcesTestCase(TestCase):
+
+    def setUp(self):
+        reset_database()
+        self.source_url = scraper.SOURCE_URL
+        if os.path.exists(scraper.STATE_PATH):
+            os.unlink(scraper.STATE_PATH)
+
+    def tearDown(self):
+        scraper.SOURCE_URL = self.source_url
+
+    def load(self, base_url, names, incremental=False, **kwargs):
+        scraper.SOURCE_URL = base_url + '/sources/%s/%s.ijson'
+        source = StubSource(incremental=incremental)
+        scraper.load_sources(source, names, **kwargs)
+        return source
+
+    def test_load_sources(self):
+        with serve_fixtures() as base_url:
+            self.load(base_url, ['alpha', 'beta', 'missing'], workers=2)
+        ids = set(id for (id,) in session.query(Entity.id))
+        self.assertEqual(ids, set(['alpha.1', 'alpha.2', 'alpha.3',
+                                   'beta.1', 'beta.2']))
+        entity = Entity.by_id('alpha', 'alpha.1')
+        self.assertEqual(len(entity.aliases), 2)
+        self.assertEqual(entity.nationalities[0].country_code, 'ru')
+        state = scraper.load_state()
+        self.assertEqual(sorted(state.keys()), ['alpha', 'beta'])
+
+    def test_counters(self):
+        metrics.reset()
+        with serve_fixtures() as base_url:
+            self.load(base_url, ['alpha', 'beta'])
+        # Lines are counted as they are read, entities once written.
+        self.assertEqual(metrics.counters['records_read'], 5)
+        self.assertEqual(metrics.counters['entities_loaded'], 5)
+        self.assertNotIn('records_decoded', metrics.counters)
+
+    def test_same_rows_in_decoding_processes(self):
+        with serve_fixtures() as base_url:
+            self.load(base_url, ['alpha', 'beta'], processes=2)
+        self.assertEqual(session.query(Entity).count(), 5)
+
+    def test_error_keeps_fetcher_traceback(self):
+        with serve_fixtures() as base_url:
+            try:
+                self.load(base_url, ['alpha', 'broken'], workers=2)
+            except ValueError:
+                frames = traceback.extract_tb(sys.exc_info()[2])
+            else:
+                self.fail("The broken source did not raise")
+        functions = [frame[2] for frame in frames]
+        self.assertIn('fetch_sources', functions)
+        self.assertIn('prepare_rows', functions)
+
+    def test_error_stops_decoding_processes(self):
+        with serve_fixtures() as base_url:
+            with self.assertRaises(ValueError):
+                self.load(base_url, ['alpha', 'broken'], processes=2)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_skip_unchanged(self):
+        root = tempfile.mkdtemp(dir=TEST_PATH)
+        shutil.copytree(FIXTURES_PATH, os.path.join(root, 'fixtures'))
+        root = os.path.join(root, 'fixtures')
+        with serve_fixtures(root) as base_url:
+            self.load(base_url, ['alpha', 'beta'])
+            # Nothing is read again from unchanged sources, so nothing
+            # is written to the emptied database.
+            reset_database()
+            source = self.load(base_url, ['alpha', 'beta'],
+                               incremental=True)
+            self.assertEqual(source.deleted, [])
+            self.assertEqual(session.query(Entity).count(), 0)
+
+            with open(os.path.join(root, 'sources', 'beta', 'beta.ijson'),
+                      'ab') as fh:
+                fh.write(b'{"id": "beta.3", "source": "beta", '
+                         b'"name": "Gamma"}\n')
+            source = self.load(base_url, ['alpha', 'beta'],
+                               incremental=True)
+        self.assertEqual(source.deleted, ['beta'])
+        ids = set(id for (id,) in session.query(Entity.id))
+        self.assertEqual(ids, set(['beta.1', 'beta.2', 'beta.3']))
+        shutil.rmtree(os.path.dirname(root))
+
+    def test_no_skip_without_incremental(self):
+        with serve_fixtures() as base_url:
+            self.load(base_url, ['alpha'])
+            reset_database()
+            self.load(base_url, ['alpha'])
+        self.assertEqual(session.query(Entity).count(), 3)
+
+    def test_delete_removed_sources(self):
+        with serve_fixtures() as base_url:
+            self.load(base_url, ['alpha', 'beta'])
+            source = self.load(base_url, ['alpha'], incremental=True)
+        self.assertEqual(source.deleted, ['beta'])
+        sources = set(s for (s,) in session.query(Entity.source))
+        self.assertEqual(sources, set(['alpha']))
+        self.assertEqual(list(scraper.load_state().keys()), ['alpha'])
@@ -0,0 +1,83 @@
+from importlib import import_module
+from unittest import TestCase
+
+from libsanctions.model import NameKey, session
+from libsanctions.screen import build_name_index, iter_names
+from libsanctions.screen import screen, screen_many
+from tests.util import load_records
+
+# The package exports the ``screen`` function under the module's name.
+screen_module = import_module('libsanctions.screen')
+
+RECORDS = [{
+    'id': 'test.2',
+    'source': 'test',
+    'name': 'Acme Ltd',
+    'aliases': [{'name': 'ACME, Ltd.'}, {'name': 'Acme Trading'}]
+}, {
+    'id': 'test.1',
+    'source': 'test',
+    'name': 'Acme Ltd.'
+}, {
+    'id': 'test.3',
+    'source': 'test',
+    'name': 'Ivan Petrov',
+    'aliases': [{'first_name': 'Ivan', 'last_name': 'Petrov'}]
+}]
+
+
+class NameIndexTestCase(TestCase):
+
+    def setUp(self):
+        load_records(RECORDS)
+        self.insert_chunk = screen_module.INSERT_CHUNK
+        self.query_chunk = screen_module.QUERY_CHUNK
+
+    def tearDown(self):
+        screen_module.INSERT_CHUNK = self.insert_chunk
+        screen_module.QUERY_CHUNK = self.query_chunk
+
+    def keys(self):
+        return sorted(session.query(NameKey.entity_id,
+                                    NameKey.fingerprint))
+
+    def test_names_in_entity_order(self):
+        ids = [entity_id for (entity_id, _) in iter_names()]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), 6)
+
+    def test_duplicates_across_aliases(self):
+        build_name_index()
+        keys = self.keys()
+        # The name and both aliases of test.2 make two fingerprints,
+        # and the composed alias of test.3 is the same as its name.
+        self.assertEqual([k[0] for k in keys],
+                         ['test.1', 'test.2', 'test.2', 'test.3'])
+        self.assertEqual(len(screen('Ivan Petrov')), 1)
+
+    def test_chunked_inserts(self):
+        build_name_index()
+        expected = self.keys()
+        screen_module.INSERT_CHUNK = 1
+        build_name_index()
+        self.assertEqual(self.keys(), expected)
+
+    def test_fingerprint_collisions(self):
+        build_name_index()
+        entities = screen('acme ltd')
+        self.assertEqual([e.id for e in entities], ['test.1', 'test.2'])
+        self.assertEqual(screen('Nobody'), [])
+
+    def test_chunked_screen_many(self):
+        build_name_index()
+        names = ['Acme Ltd', 'Acme Trading', 'Ivan Petrov', 'Nobody']
+        expected = screen_many(names)
+        screen_module.QUERY_CHUNK = 1
+        results = screen_many(names)
+        self.assertEqual(sorted(results.keys()), sorted(names))
+        for name in names:
+            self.assertEqual([e.id for e in results[name]],
+                             [e.id for e in expected[name]])
+        self.assertEqual([e.id for e in results['Acme Ltd']],
+                         ['test.1', 'test.2'])
+        self.assertEqual(results['Nobody'], [])
@@ -0,0 +1,116 @@
+import json
+import threading
+from unittest import TestCase
+from six.moves.http_client import HTTPConnection
+from six.moves.urllib.parse import urlencode
+
+from libsanctions.config import database_uri
+from libsanctions.model import Entity, Run, get_engine
+from libsanctions.screen import build_name_index
+from libsanctions.service import Service, ServiceServer
+from tests.util import load_records
+
+RECORDS = [{
+    'id': 'test.1',
+    'source': 'test',
+    'name': 'Vladimir Putin',
+    'type': 'individual',
+    'aliases': [{'name': 'Vova Putin'}],
+    'identifiers': [{'number': '123', 'country': 'Russia'}]
+}, {
+    'id': 'test.2',
+    'source': 'test',
+    'name': 'Acme Ltd',
+    'type': 'entity'
+}]
+
+
+class ServiceTestCase(TestCase):
+
+    def setUp(self):
+        load_records(RECORDS)
+        build_name_index()
+        self.service = Service(uri=database_uri(), workers=2,
+                               check_interval=0)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_lookup(self):
+        data = self.service.lookup('test.1')
+        self.assertEqual(data['name'], 'Vladimir Putin')
+        self.assertEqual(data['aliases'][0]['name'], 'Vova Putin')
+        self.assertEqual(data['identifiers'][0]['number'], '123')
+        self.assertIsNone(self.service.lookup('test.3'))
+
+    def test_screen(self):
+        results = self.service.screen_many(['vladimir  PUTIN', 'nobody'])
+        self.assertEqual(results['nobody'], [])
+        matches = results['vladimir  PUTIN']
+        self.assertEqual([m['id'] for m in matches], ['test.1'])
+        # The same JSON as a lookup.
+        self.assertEqual(matches[0], self.service.lookup('test.1'))
+
+    def test_cache(self):
+        first = self.service.lookup('test.2')
+        self.assertIs(self.service.lookup('test.2'), first)
+        self.assertEqual(self.service.cache.stats()['hits'], 1)
+
+    def test_invalidate_on_run(self):
+        self.assertEqual(self.service.lookup('test.2')['name'], 'Acme Ltd')
+        # Another process changes the data and records its run.
+        table = Entity.__table__
+        with get_engine().begin() as conn:
+            conn.execute(table.update().where(table.c.id == 'test.2')
+                         .values(name='Acme Inc'))
+        self.assertEqual(self.service.lookup('test.2')['name'], 'Acme Ltd')
+        run = Run('test')
+        with get_engine().begin() as conn:
+            conn.execute(Run.__table__.insert().values(
+                source=run.source, finished_at=run.finished_at))
+        self.assertEqual(self.service.lookup('test.2')['name'], 'Acme Inc')
+
+    def test_close(self):
+        self.service.lookup('test.1')
+        self.service.close()
+        for batcher in (self.service.entities, self.service.screens):
+            self.assertFalse(batcher.thread.is_alive())
+            self.assertRaises(RuntimeError, batcher.get, 'test.1')
+
+
+class ServerTestCase(TestCase):
+
+    def setUp(self):
+        load_records(RECORDS)
+        build_name_index()
+        self.service = Service(uri=database_uri(), workers=2)
+        self.server = ServiceServer(('127.0.0.1', 0), self.service)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.conn = HTTPConnection('127.0.0.1', self.server.server_port)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+
+    def get(self, path):
+        self.conn.request('GET', path)
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_requests(self):
+        status, entity = self.get('/entities/test.1')
+        self.assertEqual(status, 200)
+        self.assertEqual(entity['id'], 'test.1')
+        status, data = self.get('/screen?%s' % urlencode({'name': 'Acme'}))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['results'], {'Acme': []})
+        status, data = self.get('/screen?%s' %
+                                urlencode({'name': 'Vladimir Putin'}))
+        self.assertEqual(data['results']['Vladimir Putin'], [entity])
+        self.assertEqual(self.get('/entities/test.3')[0], 404)
+        self.assertEqual(self.get('/screen')[0], 400)
+        self.assertEqual(self.get('/other')[0], 404)
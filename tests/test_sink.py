@@ -0,0 +1,128 @@
+import os
+import zlib
+import hashlib
+from unittest import TestCase
+
+from libsanctions.sink import ExportSink, FORMATS, parse_compression
+from libsanctions.sink import compression_for, check_compression, DEFAULT
+from tests import TEST_PATH
+
+
+class FakeClient(object):
+    # Records the S3 calls of a multipart upload.
+
+    def __init__(self):
+        self.calls = []
+        self.parts = []
+
+    def create_multipart_upload(self, **kwargs):
+        self.calls.append('create')
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Body=None, PartNumber=None, **kwargs):
+        self.calls.append('part')
+        self.parts.append(Body)
+        return {'ETag': 'etag-%s' % PartNumber}
+
+    def complete_multipart_upload(self, MultipartUpload=None, **kwargs):
+        self.calls.append('complete')
+        self.completed = MultipartUpload['Parts']
+
+    def abort_multipart_upload(self, **kwargs):
+        self.calls.append('abort')
+
+    def copy(self, copy_source, bucket, key, ExtraArgs=None):
+        self.calls.append('copy')
+        self.copied = key
+
+
+class FakeArchive(object):
+    # The attributes of ``morphium.Archive`` which the sink uses.
+    bucket = 'bucket'
+    prefix = 'v1/sources/test'
+    tag = '20180101'
+
+    def __init__(self, client=None):
+        self.client = client
+
+
+def _data(lines=2000):
+    # Hashes, so the compressed data spans several parts.
+    return [('%s\n' % hashlib.sha1(str(i).encode('ascii')).hexdigest())
+            for i in range(lines)]
+
+
+def _gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class ExportSinkTestCase(TestCase):
+
+    def test_multipart_upload(self):
+        client = FakeClient()
+        sink = ExportSink(FakeArchive(client), 'test.ijson', TEST_PATH,
+                          part_size=256)
+        lines = _data()
+        for line in lines:
+            sink.write(line)
+        url = sink.close()
+        self.assertEqual(sink.name, 'test.ijson.gz')
+        self.assertEqual(url, 'http://bucket/v1/sources/test/20180101/'
+                              'test.ijson.gz')
+        self.assertEqual(client.calls[0], 'create')
+        self.assertEqual(client.calls[-2:], ['complete', 'copy'])
+        self.assertGreater(len(client.parts), 1)
+        self.assertEqual([p['PartNumber'] for p in client.completed],
+                         list(range(1, len(client.parts) + 1)))
+        self.assertEqual(client.copied, 'v1/sources/test/latest/'
+                                        'test.ijson.gz')
+        data = _gunzip(b''.join(client.parts))
+        self.assertEqual(data.decode('utf-8'), ''.join(lines))
+        self.assertEqual(sink.tell(), len(data))
+
+    def test_abort_on_error(self):
+        client = FakeClient()
+        try:
+            with ExportSink(FakeArchive(client), 'test.csv', TEST_PATH):
+                raise RuntimeError('export failed')
+        except RuntimeError:
+            pass
+        self.assertEqual(client.calls, ['create', 'abort'])
+
+    def test_local_file(self):
+        sink = ExportSink(FakeArchive(), 'local.csv', TEST_PATH,
+                          compression='bz2')
+        with sink:
+            sink.write(u'a,b\n')
+        self.assertIsNone(sink.url)
+        file_path = os.path.join(TEST_PATH, 'local.csv.bz2')
+        self.assertTrue(os.path.exists(file_path))
+        os.unlink(file_path)
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            ExportSink(FakeArchive(), 'test.csv', TEST_PATH,
+                       compression='zip')
+
+
+class CompressionTestCase(TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_compression(None), {})
+        self.assertEqual(parse_compression('gzip'), {DEFAULT: 'gzip'})
+        compression = parse_compression('gzip, snapshot=none, ijson=bz2')
+        self.assertEqual(compression, {DEFAULT: 'gzip', 'snapshot': None,
+                                       'ijson': 'bz2'})
+        self.assertEqual(compression_for(compression, 'snapshot'), None)
+        self.assertEqual(compression_for(compression, 'ijson'), 'bz2')
+        self.assertEqual(compression_for(compression, 'entities'), 'gzip')
+        self.assertEqual(compression_for('bz2', 'entities'), 'bz2')
+        self.assertEqual(compression_for(None, 'entities'), None)
+
+    def test_check(self):
+        check_compression({'snapshot': None}, ['snapshot', 'ijson'])
+        with self.assertRaises(ValueError):
+            check_compression({'ijson': 'zip'}, ['snapshot', 'ijson'])
+        if 'lzma' not in FORMATS:
+            with self.assertRaises(ValueError):
+                check_compression('lzma', ['ijson'])
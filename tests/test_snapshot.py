@@ -0,0 +1,73 @@
+import io
+from unittest import TestCase
+
+from benchmarks.generate import generate_entities
+from libsanctions.export import write_snapshot
+from libsanctions.model import Entity, Alias, session
+from libsanctions.snapshot import Snapshot, SnapshotWriter
+from tests.util import load_records
+
+
+class SnapshotTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        records = list(generate_entities(300))
+        # Ids which sort differently by bytes than by characters, and an
+        # alias of an entity which is not stored.
+        records.append({'id': u'bench.\xe9', 'source': 'bench',
+                        'name': u'\xc9mile', 'aliases': [{'name': 'E'}]})
+        records.append({'id': u'bench.Z', 'source': 'bench', 'name': 'Z'})
+        load_records(records)
+        alias = Alias(u'bench.missing', name='Nobody')
+        alias.source = 'bench'
+        session.add(alias)
+        session.commit()
+        cls.expected = dict((e.id, e.to_json())
+                            for e in session.query(Entity))
+        cls.snapshot = Snapshot(write_snapshot('test'))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.snapshot.close()
+
+    def test_same_json_as_entities(self):
+        self.assertEqual(len(self.snapshot), len(self.expected))
+        for entity in self.snapshot:
+            self.assertEqual(entity.to_json(), self.expected[entity.id])
+
+    def test_get(self):
+        for entity_id in self.expected:
+            self.assertEqual(self.snapshot.get(entity_id).id, entity_id)
+        self.assertEqual(self.snapshot.get(u'bench.\xe9')['name'], u'\xc9mile')
+        self.assertIsNone(self.snapshot.get('bench.missing'))
+
+    def test_small_intern_table(self):
+        # Values are stored again once the table has been started over.
+        writer = SnapshotWriter(intern_size=2)
+        ids = [writer.intern(v) for v in ('a', 'b', 'a', 'c', 'a', None)]
+        self.assertEqual(ids[:3], [1, 2, 1])
+        self.assertEqual(ids[5], 0)
+        self.assertNotEqual(ids[4], 1)
+        writer.close()
+
+
+class SnapshotWriterTestCase(TestCase):
+
+    def write(self, entities, children):
+        writer = SnapshotWriter()
+        writer.add_entities(['id', 'name'], entities)
+        writer.add_children('aliases', ['name'], children)
+        fh = io.BytesIO()
+        writer.write(fh)
+        writer.close()
+        return fh.getvalue()
+
+    def test_rejects_unsorted_ids(self):
+        with self.assertRaises(ValueError):
+            self.write([[u'b', u'B'], [u'a', u'A']], [])
+
+    def test_rejects_ungrouped_children(self):
+        entities = [[u'a', u'A'], [u'b', u'B']]
+        with self.assertRaises(ValueError):
+            self.write(entities, [(1, [u'B1']), (0, [u'A1'])])
@@ -0,0 +1,145 @@
+from unittest import TestCase
+from sqlalchemy import func, select
+
+from libsanctions.model import Entity, Alias, get_engine, session, saves
+from libsanctions.source import Source
+from tests.util import reset_database
+
+
+def committed_count():
+    # Read through a separate connection, which only sees commits.
+    with get_engine().connect() as conn:
+        q = select([func.count()]).select_from(Entity.__table__)
+        return conn.execute(q).scalar()
+
+
+class SaveBatchTestCase(TestCase):
+
+    def setUp(self):
+        reset_database()
+
+    def tearDown(self):
+        session.remove()
+
+    def test_batch_belongs_to_source(self):
+        source = Source('test')
+        other = Source('other')
+        self.assertIsNot(source.saves, other.saves)
+        self.assertIsNot(source.saves, saves)
+        entity = source.create_entity('a')
+        self.assertIs(entity.batch, source.saves)
+        entity.save()
+        self.assertEqual(source.saves.entities, [entity])
+        self.assertEqual(other.saves.entities, [])
+        self.assertEqual(saves.entities, [])
+
+    def test_commit_in_batches(self):
+        source = Source('test')
+        source.saves.size = 3
+        for key in ('a', 'b'):
+            source.create_entity(key).save()
+        self.assertEqual(committed_count(), 0)
+        source.create_entity('c').save()
+        self.assertEqual(committed_count(), 3)
+        source.create_entity('d').save()
+        source.saves.flush()
+        self.assertEqual(committed_count(), 4)
+
+    def test_create_entity_returns_same_object(self):
+        source = Source('test')
+        entity = source.create_entity('a', 'b')
+        self.assertEqual(entity.id, 'test.a-b')
+        self.assertIs(source.create_entity('a', 'b'), entity)
+
+
+class IncrementalTestCase(TestCase):
+
+    def setUp(self):
+        reset_database()
+
+    def tearDown(self):
+        session.remove()
+
+    def run_source(self, entities, commit_size=None, query=False):
+        """Scrape ``entities``, a dict of alias names by key, and return
+        the change counts of the run."""
+        source = Source('test', incremental=True)
+        if commit_size is not None:
+            source.saves.size = commit_size
+        for key, aliases in sorted(entities.items()):
+            entity = source.create_entity(key)
+            entity.name = key.upper()
+            for name in aliases:
+                entity.create_alias(name=name)
+            entity.save()
+            if query:
+                # Queries autoflush the session.
+                session.query(Entity).count()
+        source.saves.flush()
+        source.reconcile()
+        session.remove()
+        return source.changes
+
+    def stored_aliases(self):
+        aliases = {}
+        for entity_id, name in session.query(Alias.entity_id, Alias.name):
+            aliases.setdefault(entity_id, []).append(name)
+        return dict((k, sorted(v)) for (k, v) in aliases.items())
+
+    def test_unchanged_run(self):
+        entities = {'a': ['A1', 'A2'], 'b': ['B1'], 'c': []}
+        changes = self.run_source(entities)
+        self.assertEqual(changes['inserted'], 3)
+        changes = self.run_source(entities, query=True)
+        self.assertEqual(changes['unchanged'], 3)
+        self.assertEqual(changes['inserted'] + changes['updated'] +
+                         changes['deleted'], 0)
+        self.assertEqual(self.stored_aliases(), {
+            'test.a': ['A1', 'A2'],
+            'test.b': ['B1']
+        })
+
+    def test_changes(self):
+        self.run_source({'a': ['A1'], 'b': ['B1'], 'c': []})
+        changes = self.run_source({'a': ['A1'], 'b': ['B2'], 'd': ['D1']})
+        self.assertEqual(changes, {'inserted': 1, 'updated': 1,
+                                   'unchanged': 1, 'deleted': 1})
+        self.assertEqual(self.stored_aliases(), {
+            'test.a': ['A1'],
+            'test.b': ['B2'],
+            'test.d': ['D1']
+        })
+        ids = set(id for (id,) in session.query(Entity.id))
+        self.assertEqual(ids, set(['test.a', 'test.b', 'test.d']))
+
+    def test_entity_completed_after_commit(self):
+        # The scraper comes back to an entity after its first save has
+        # been committed, and adds more to it.
+        def scrape():
+            source = Source('test', incremental=True)
+            source.saves.size = 1
+            for key in ('a', 'b', 'a'):
+                entity = source.create_entity(key)
+                entity.create_alias(name='%s%s' % (key, len(entity.aliases)))
+                entity.save()
+                session.query(Entity).count()
+            source.saves.flush()
+            source.reconcile()
+            session.remove()
+            return source.changes
+
+        self.assertEqual(scrape()['inserted'], 2)
+        changes = scrape()
+        self.assertEqual(changes['unchanged'], 2)
+        self.assertEqual(changes['updated'], 0)
+        self.assertEqual(self.stored_aliases(), {
+            'test.a': ['a0', 'a1'],
+            'test.b': ['b0']
+        })
+
+    def test_no_hashes_without_incremental(self):
+        source = Source('test')
+        source.create_entity('a').save()
+        source.saves.flush()
+        entity = session.query(Entity).one()
+        self.assertIsNone(entity.content_hash)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+from unittest import TestCase, skipUnless
+
+from benchmarks.generate import generate_entities
+from benchmarks.readers import write_table
+from libsanctions.tabular import iter_rows, iter_row_chunks
+from libsanctions.tabular import normalize_headers
+from tests import TEST_PATH
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+CSV = u'''Sanctions list,,,
+Number,Name,Name,
+ 1 , Ivan Petrov ,Иван,extra
+,,,
+2,Ocean Star
+'''
+
+
+class IterRowsTestCase(TestCase):
+
+    def setUp(self):
+        self.file_path = os.path.join(TEST_PATH, 'list.csv')
+        with open(self.file_path, 'wb') as fh:
+            fh.write(CSV.encode('utf-8'))
+
+    def tearDown(self):
+        os.unlink(self.file_path)
+
+    def test_normalize_headers(self):
+        self.assertEqual(normalize_headers(['Listed at', '', 'Listed at']),
+                         ['listed_at', 'column_1', 'column_2'])
+
+    def test_csv(self):
+        rows = list(iter_rows(self.file_path, header_row=1))
+        self.assertEqual(rows, [
+            {'number': u'1', 'name': u'Ivan Petrov', 'column_2': u'Иван',
+             'column_3': u'extra'},
+            {'number': u'2', 'name': u'Ocean Star', 'column_2': None,
+             'column_3': None},
+        ])
+
+    def test_chunks(self):
+        chunks = list(iter_row_chunks(self.file_path, chunk_size=1,
+                                      header_row=1))
+        self.assertEqual([len(c) for c in chunks], [1, 1])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            list(iter_rows('list.pdf'))
+
+    @skipUnless(openpyxl, "openpyxl is not installed")
+    def test_xlsx_same_as_csv(self):
+        records = list(generate_entities(20))
+        rows = {}
+        for extension in ('.csv', '.xlsx'):
+            file_path = os.path.join(TEST_PATH, 'table' + extension)
+            write_table(records, file_path)
+            rows[extension] = list(iter_rows(file_path))
+            os.unlink(file_path)
+        self.assertEqual(len(rows['.xlsx']), 20)
+        self.assertEqual(rows['.xlsx'], rows['.csv'])
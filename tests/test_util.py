@@ -0,0 +1,44 @@
+import os
+from unittest import TestCase
+
+from lxml import etree
+
+from benchmarks.generate import generate_entities
+from benchmarks.readers import SDN_NAMESPACE, write_sdn_xml
+from libsanctions.util import iterparse_records, remove_namespace
+from tests import TEST_PATH
+
+
+class IterparseRecordsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.file_path = os.path.join(TEST_PATH, 'sdn.xml')
+        write_sdn_xml(list(generate_entities(50)), cls.file_path, repeat=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.unlink(cls.file_path)
+
+    def test_same_records_as_document(self):
+        doc = etree.parse(self.file_path)
+        remove_namespace(doc, SDN_NAMESPACE)
+        expected = [etree.tostring(e) for e in doc.findall('.//sdnEntry')]
+        for namespace in (SDN_NAMESPACE, None):
+            records = iterparse_records(self.file_path, 'sdnEntry',
+                                        namespace=namespace)
+            # Serialise them before the next record clears them.
+            records = [etree.tostring(e) for e in records]
+            self.assertEqual(records, expected)
+
+    def test_records_are_released(self):
+        count = 0
+        for elem in iterparse_records(self.file_path, 'sdnEntry',
+                                      SDN_NAMESPACE):
+            count += 1
+            # Only the record before this one is left, and it is empty.
+            previous = list(elem.itersiblings(preceding=True))
+            self.assertLessEqual(len(previous), 1)
+            if count > 1:
+                self.assertEqual(len(previous[0]), 0)
+        self.assertEqual(count, 100)
@@ -0,0 +1,101 @@
+import os
+import threading
+from hashlib import sha1
+from contextlib import contextmanager
+from six.moves.BaseHTTPServer import HTTPServer
+from six.moves.SimpleHTTPServer import SimpleHTTPRequestHandler
+from six.moves.urllib.parse import urlparse, unquote
+
+from libsanctions.model import Base, Entity, get_engine, session
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def reset_database():
+    session.remove()
+    Base.metadata.drop_all(get_engine())
+    Base.metadata.create_all(get_engine())
+
+
+def load_records(records):
+    reset_database()
+    Entity.bulk_from_json(records)
+    session.commit()
+
+
+class StubArchive(object):
+    # Stands in for ``morphium.Archive``; keeps the files where they are.
+
+    client = None
+
+    def __init__(self):
+        self.uploaded = []
+
+    def upload_file(self, file_path, mime_type=None):
+        self.uploaded.append(os.path.basename(file_path))
+
+
+class FailingArchive(StubArchive):
+
+    def upload_file(self, file_path, mime_type=None):
+        if file_path.endswith('.delta.ijson'):
+            raise IOError('upload failed')
+
+
+def stored_entities():
+    """The JSON of all stored entities by id, without the timestamps."""
+    entities = {}
+    for entity in session.query(Entity):
+        data = entity.to_json()
+        data.pop('timestamp')
+        entities[entity.id] = data
+    return entities
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Serve the files below ``root`` rather than the working directory,
+    with an ``ETag`` of their content which is checked against
+    ``If-None-Match``."""
+    root = FIXTURES_PATH
+    etag = None
+
+    def translate_path(self, path):
+        parts = unquote(urlparse(path).path).split('/')
+        parts = [p for p in parts if p not in ('', '.', '..')]
+        return os.path.join(self.root, *parts)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            with open(path, 'rb') as fh:
+                self.etag = '"%s"' % sha1(fh.read()).hexdigest()
+            if self.headers.get('If-None-Match') == self.etag:
+                self.send_response(304)
+                self.end_headers()
+                return None
+        return SimpleHTTPRequestHandler.send_head(self)
+
+    def end_headers(self):
+        if self.etag is not None:
+            self.send_header('ETag', self.etag)
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_fixtures(root=FIXTURES_PATH, handler=FixtureHandler):
+    """Serve ``root`` over HTTP on a free port; yields the base URL."""
+    class Handler(handler):
+        pass
+    Handler.root = root
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:%s' % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()